@@ -2,22 +2,42 @@ import aiohttp
 from aiohttp import web
 import asyncio
 import asynqp
+import collections
 import logging
-import json
 import yaml
-import consul.aio
 import os
 import uvicorn
 from fastapi import FastAPI
-import swagger_client
-from swagger_client import Configuration
-from swagger_client.rest import ApiException
+from starlette.responses import Response
 
+from app_sdk.amqp import (APPLICATION_BINDING, ack, binding_keys,
+                          stale_binding_keys)
+from app_sdk.ari import GATEWAY_ROUTING, AriClient
+from app_sdk.backoff import Backoff
+from app_sdk.backpressure import EventQueue
 from app_sdk.bridge import BridgeMixin
+from app_sdk.bridge_registry import CONSUL_REGISTRY, MEMORY_REGISTRY
+from app_sdk.catalog import AsteriskCatalog
 from app_sdk.channel import ChannelMixin, Channel
+from app_sdk.contexts import ContextStore
+from app_sdk.decoder import app_filter, get_decoder
+from app_sdk.dispatcher import Dispatcher
+from app_sdk.events import EventRegistry, event_handler
 from app_sdk.media import MediaMixin
+from app_sdk.registration import AriRegistrations, ConsulRegistration
+from app_sdk.metrics import COUNTER, Registry
+from app_sdk.placement import (CHANNELS_LOAD, FIRST_CALLER_PLACEMENT,
+                               create_placement)
+from app_sdk.policy import CallPolicy
+from app_sdk.websocket import WebSocketTransport
+from app_sdk.workers import WorkerPool, originating_worker, read_forwarded
 
 RECONNECT_RATE = 1
+RECONNECT_MAX_DELAY = 30
+
+# event transports
+AMQP_TRANSPORT = 'amqp'
+WEBSOCKET_TRANSPORT = 'websocket'
 
 logger = logging.getLogger(__name__)
 
@@ -27,20 +47,78 @@ class Config:
     def __init__(self):
         self.host = os.environ.get('APP_HOST', '127.0.0.1')
         self.port = int(os.environ.get('APP_PORT', '8000'))
+        self.workers = int(os.environ.get('APP_WORKERS', '1'))
 
         self.api_endpoint = os.environ.get('API_ENDPOINT',
                                            'http://localhost:8088')
         self.api_username = os.environ.get('API_USERNAME', 'wazo')
         self.api_password = os.environ.get('API_PASSWORD', 'wazo')
+        self.api_routing = os.environ.get('API_ROUTING', GATEWAY_ROUTING)
+        self.api_asterisk_port = int(os.environ.get('API_ASTERISK_PORT',
+                                                    '8888'))
+        self.api_pool_size = int(os.environ.get('API_POOL_SIZE', '100'))
+        self.api_pool_size_per_host = int(os.environ.get(
+            'API_POOL_SIZE_PER_HOST', '0'))
+        self.api_keepalive = float(os.environ.get('API_KEEPALIVE', '30'))
+        self.api_timeout = float(os.environ.get('API_TIMEOUT', '10'))
+        self.api_connect_timeout = float(os.environ.get(
+            'API_CONNECT_TIMEOUT', '2'))
+        self.api_timeouts = dict()
+        self.api_retries = int(os.environ.get('API_RETRIES', '2'))
+        self.api_breaker_threshold = int(os.environ.get(
+            'API_BREAKER_THRESHOLD', '5'))
+        self.api_breaker_reset = float(os.environ.get('API_BREAKER_RESET',
+                                                      '30'))
 
         self.amqp_host = os.environ.get('AMQP_HOST', '127.0.0.1')
         self.amqp_port = int(os.environ.get('AMQP_PORT', '5672'))
         self.amqp_username = os.environ.get('AMQP_USERNAME', 'guest')
         self.amqp_password = os.environ.get('AMQP_PASSWORD', 'guest')
         self.amqp_exchange = os.environ.get('AMQP_EXCHANGE', 'wazo')
+        self.amqp_binding = os.environ.get('AMQP_BINDING',
+                                           APPLICATION_BINDING)
+        self.amqp_routing_key = os.environ.get('AMQP_ROUTING_KEY',
+                                               'stasis.app.{app}')
+        self.amqp_event_types = [
+            t for t in os.environ.get('AMQP_EVENT_TYPES', '').split(',') if t]
+        self.amqp_prefetch = int(os.environ.get('AMQP_PREFETCH', '100'))
+        self.amqp_ack_batch = int(os.environ.get('AMQP_ACK_BATCH', '1'))
+
+        self.events_transport = os.environ.get('EVENTS_TRANSPORT',
+                                               AMQP_TRANSPORT)
+        self.events_queue_size = int(os.environ.get('EVENTS_QUEUE_SIZE',
+                                                    '10000'))
+        self.events_high_watermark = float(os.environ.get(
+            'EVENTS_HIGH_WATERMARK', '0.8'))
+        self.events_low_watermark = float(os.environ.get(
+            'EVENTS_LOW_WATERMARK', '0.2'))
+        self.events_decoder = os.environ.get('EVENTS_DECODER', 'auto')
+        self.channel_extras = [
+            f for f in os.environ.get('CHANNEL_EXTRAS', '').split(',') if f]
+        self.events_prefilter = os.environ.get(
+            'EVENTS_PREFILTER', 'true').lower() == 'true'
+
+        self.contexts_ttl = int(os.environ.get('CONTEXTS_TTL', '14400'))
+        self.contexts_sweep_interval = int(os.environ.get(
+            'CONTEXTS_SWEEP_INTERVAL', '30'))
+
+        self.bridge_add_window = float(os.environ.get('BRIDGE_ADD_WINDOW',
+                                                      '0.005'))
+        self.bridge_registry = os.environ.get('BRIDGE_REGISTRY',
+                                              MEMORY_REGISTRY)
+        self.mesh_fanout = int(os.environ.get('MESH_FANOUT', '0'))
+        self.bridge_placement = os.environ.get('BRIDGE_PLACEMENT',
+                                               FIRST_CALLER_PLACEMENT)
+        self.bridge_placement_load = os.environ.get('BRIDGE_PLACEMENT_LOAD',
+                                                    CHANNELS_LOAD)
+
+        self.dispatch_workers = int(os.environ.get('DISPATCH_WORKERS', '16'))
+        self.dispatch_queue_size = int(os.environ.get('DISPATCH_QUEUE_SIZE',
+                                                      '100'))
 
         self.consul_host = os.environ.get('CONSUL_HOST', '127.0.0.1')
         self.consul_port = int(os.environ.get('CONSUL_PORT', '8500'))
+        self.consul_ttl = int(os.environ.get('CONSUL_TTL', '15'))
 
     def from_conf(self, conf="app.yml"):
         doc = {}
@@ -50,12 +128,29 @@ class Config:
 
         self.host = doc.get('address', self.host)
         self.port = doc.get('port', self.port)
+        self.workers = doc.get('workers', self.workers)
 
         api = doc.get('api')
         if api:
             self.api_endpoint = api.get('endpoint')
             self.api_username = api.get('username')
             self.api_password = api.get('password')
+            self.api_routing = api.get('routing', self.api_routing)
+            self.api_asterisk_port = api.get('asterisk_port',
+                                             self.api_asterisk_port)
+            self.api_pool_size = api.get('pool_size', self.api_pool_size)
+            self.api_pool_size_per_host = api.get(
+                'pool_size_per_host', self.api_pool_size_per_host)
+            self.api_keepalive = api.get('keepalive', self.api_keepalive)
+            self.api_timeout = api.get('timeout', self.api_timeout)
+            self.api_connect_timeout = api.get('connect_timeout',
+                                               self.api_connect_timeout)
+            self.api_timeouts = api.get('timeouts', self.api_timeouts)
+            self.api_retries = api.get('retries', self.api_retries)
+            self.api_breaker_threshold = api.get(
+                'breaker_threshold', self.api_breaker_threshold)
+            self.api_breaker_reset = api.get('breaker_reset',
+                                             self.api_breaker_reset)
 
         amqp = doc.get('amqp')
         if amqp:
@@ -64,26 +159,90 @@ class Config:
             self.amqp_username = amqp.get('username')
             self.amqp_password = amqp.get('password')
             self.amqp_exchange = amqp.get('exchange')
+            self.amqp_binding = amqp.get('binding', self.amqp_binding)
+            self.amqp_routing_key = amqp.get('routing_key',
+                                             self.amqp_routing_key)
+            self.amqp_event_types = amqp.get('event_types',
+                                             self.amqp_event_types)
+            self.amqp_prefetch = amqp.get('prefetch', self.amqp_prefetch)
+            self.amqp_ack_batch = amqp.get('ack_batch', self.amqp_ack_batch)
+
+        events = doc.get('events')
+        if events:
+            self.events_transport = events.get('transport',
+                                               self.events_transport)
+            self.events_queue_size = events.get('queue_size',
+                                                self.events_queue_size)
+            self.events_high_watermark = events.get(
+                'high_watermark', self.events_high_watermark)
+            self.events_low_watermark = events.get(
+                'low_watermark', self.events_low_watermark)
+            self.events_decoder = events.get('decoder', self.events_decoder)
+            self.channel_extras = events.get('channel_extras',
+                                             self.channel_extras)
+            self.events_prefilter = events.get('prefilter',
+                                               self.events_prefilter)
+
+        contexts = doc.get('contexts')
+        if contexts:
+            self.contexts_ttl = contexts.get('ttl', self.contexts_ttl)
+            self.contexts_sweep_interval = contexts.get(
+                'sweep_interval', self.contexts_sweep_interval)
+
+        bridges = doc.get('bridges')
+        if bridges:
+            self.bridge_add_window = bridges.get('add_window',
+                                                 self.bridge_add_window)
+            self.bridge_registry = bridges.get('registry',
+                                               self.bridge_registry)
+            self.mesh_fanout = bridges.get('mesh_fanout', self.mesh_fanout)
+            self.bridge_placement = bridges.get('placement',
+                                                self.bridge_placement)
+            self.bridge_placement_load = bridges.get(
+                'placement_load', self.bridge_placement_load)
+
+        dispatch = doc.get('dispatch')
+        if dispatch:
+            self.dispatch_workers = dispatch.get('workers',
+                                                 self.dispatch_workers)
+            self.dispatch_queue_size = dispatch.get('queue_size',
+                                                    self.dispatch_queue_size)
 
         consul = doc.get('consul')
         if consul:
             self.consul_host = consul.get('host')
             self.consul_port = consul.get('port')
+            self.consul_ttl = consul.get('ttl', self.consul_ttl)
+
+    def validate(self):
+        if not (0 <= self.events_low_watermark <
+                self.events_high_watermark <= 1):
+            raise ValueError(
+                "events watermarks must be 0 <= low < high <= 1, got "
+                "low %s high %s" % (self.events_low_watermark,
+                                    self.events_high_watermark))
 
 
 class Context:
 
+    __slots__ = ('asterisk_id', 'channel', '_user_data', '_key', '_hash')
+
     def __init__(self, asterisk_id, channel):
         self.asterisk_id = asterisk_id
         self.channel = channel
         self._user_data = None
 
+        # contexts are looked up on every event, hash once
+        self._key = (asterisk_id, channel.id)
+        self._hash = hash(self._key)
+
     def __hash__(self):
-        return hash((self.asterisk_id, self.channel.id))
+        return self._hash
 
     def __eq__(self, other):
-        return ((self.asterisk_id, self.channel.id) ==
-                (other.asterisk_id, other.channel.id))
+        # also equal to its (asterisk_id, channel_id) key, so that the
+        # contexts can be looked up without building one
+        return self._key == getattr(other, '_key', other)
 
     def __ne__(self, other):
         return not(self == other)
@@ -100,10 +259,10 @@ class Context:
     user_data = property(get_user_data, set_user_data, del_user_data)
 
     def __str__(self):
-        return "%s/%s" % (self.asterisk_id, self.channel.id)
+        return "%s/%s" % self._key
 
     def __repr__(self):
-        return "%s/%s" % (self.asterisk_id, self.channel.id)
+        return "%s/%s" % self._key
 
     @property
     def server_id(self):
@@ -112,19 +271,27 @@ class Context:
 
 class Consumer:
 
-    def __init__(self, queue):
+    def __init__(self, queue, on_lost):
         self.queue = queue
+        self.on_lost = on_lost
 
     def __call__(self, msg):
-        self.queue.put_nowait(msg)
+        try:
+            self.queue.put_nowait(msg)
+        except asyncio.QueueFull:
+            # only the messages already in flight when the consumption got
+            # paused can end up here, let the broker keep them
+            msg.reject(requeue=True)
 
     def on_error(self, exc):
         logger.error("Connection lost while consuming queue : %s" % exc)
+        self.on_lost(exc)
 
 
 class Application(BridgeMixin, ChannelMixin, MediaMixin):
 
     def __init__(self, config, id, name, register=False):
+        config.validate()
         super(Application, self).__init__(config, id, name, register)
 
         self.config = config
@@ -134,66 +301,253 @@ class Application(BridgeMixin, ChannelMixin, MediaMixin):
 
         self.fastapi = FastAPI()
 
-        self.contextes = dict()
-
-        configuration = Configuration()
-        configuration.host = "%s/ari" % config.api_endpoint
-        configuration.username = config.api_username
-        configuration.password = config.api_password
+        self.metrics = Registry()
+        self.events_received = self.metrics.counter(
+            'app_events_total', 'Stasis events received', ('type',))
+
+        self.contextes = ContextStore(config.contexts_ttl)
+        # Asterisk hosting the master of a new bridge
+        self.placement = create_placement(config, self.contextes)
+
+        self.dispatcher = Dispatcher(
+            config.dispatch_workers, config.dispatch_queue_size,
+            self.metrics.histogram('app_handler_duration_seconds',
+                                   'Event handler durations', ('handler',)))
+
+        self.event_queue = None
+        self.overloaded = False
+        self.amqp_queue = None
+        self.amqp_consumer = None
+        self.amqp_stats = {
+            'connected': False,
+            'reconnects': 0,
+            'last_recovery_time': None,
+            'total_recovery_time': 0.0,
+        }
 
-        self.api_client = swagger_client.ApiClient(configuration)
+        self.events = EventRegistry(self)
+        self.dropped_events = collections.Counter()
+
+        self.register_metrics()
+
+        self.decode = get_decoder(config.events_decoder)
+        self.prefilter = None
+        if config.events_prefilter:
+            self.prefilter = app_filter(id)
+
+        self.worker_index = None
+        self.catalog = AsteriskCatalog(config)
+        self.catalog.add_listener(self._on_nodes_change)
+        self.registration = ConsulRegistration(
+            config, self.name, "apps/%s" % self.id, self.load)
+        self.ari_policy = CallPolicy(
+            config,
+            self.metrics.histogram('app_ari_call_duration_seconds',
+                                   'ARI call durations',
+                                   ('operation', 'asterisk_id')))
+        self.setup_ari()
+
+    def register_metrics(self):
+        self.metrics.callback(
+            'app_events_dropped_total', 'Stasis events without handler',
+            lambda: [((t,), n) for (t, n) in self.dropped_events.items()],
+            type=COUNTER, labels=('type',))
+        self.metrics.callback('app_contexts', 'Live contexts',
+                              lambda: len(self.contextes))
+        self.metrics.callback('app_bridges', 'Known master bridges',
+                              lambda: len(self.bridge_registry.masters))
+        self.metrics.callback('app_bridge_trunks',
+                              'Trunks between Asterisk of the bridges',
+                              lambda: len(self.bridge_registry.trunks))
+        self.metrics.callback(
+            'app_event_queue_depth', 'Events waiting to be processed',
+            lambda: self.event_queue.qsize() if self.event_queue else 0)
+        self.metrics.callback(
+            'app_dispatch_queue_depth', 'Events waiting per dispatch worker',
+            lambda: [((str(i),), d)
+                     for (i, d) in enumerate(self.dispatcher.depths())],
+            labels=('worker',))
+        self.metrics.callback('app_overloaded',
+                              'Event queue above high watermark',
+                              lambda: int(self.overloaded))
+        self.metrics.callback('app_amqp_connected', 'AMQP connection state',
+                              lambda: int(self.amqp_stats['connected']))
+        self.metrics.callback('app_amqp_reconnects_total',
+                              'AMQP reconnections',
+                              lambda: self.amqp_stats['reconnects'],
+                              type=COUNTER)
+        self.metrics.callback(
+            'app_ari_circuit_open', 'ARI circuit breaker open per Asterisk',
+            lambda: [((a,), int(b.state != 'closed'))
+                     for (a, b) in self.ari_policy.breakers.items()],
+            labels=('asterisk_id',))
+
+    def setup_ari(self):
+        self.ari = AriClient(self.config, self.catalog)
+        self.api_client = self.ari.api_client
+
+    async def ari_call(self, operation, asterisk_id, func, *args, **kwargs):
+        """Call an ARI method on an Asterisk through the call policy."""
+        return await self.ari_policy.call(operation, asterisk_id, func,
+                                          *args, **kwargs)
 
     def launch(self):
+        if self.config.workers > 1:
+            return self.launch_workers()
+
         loop = asyncio.get_event_loop()
-        queue = asyncio.Queue()
+        queue = self.create_event_queue()
 
-        reconnect_task = loop.create_task(self.reconnector(loop, queue))
-        process_msgs_task = loop.create_task(
-            self.process_msgs(queue))
+        tasks = [
+            loop.create_task(self.process_msgs(queue)),
+            loop.create_task(self.sweep_contexts()),
+            loop.create_task(self.bridge_registry.run(loop)),
+        ]
+        tasks += self.create_bus_tasks(loop, queue)
 
-        # mainly for dev or debug purpose when not using consul
-        if self.register:
-            ari_register_task = loop.create_task(self.register_all_ari(loop))
+        self.run_until_complete(loop, loop.create_task(self.run_api()), tasks)
+
+    def launch_workers(self):
+        # the participants of a bridge hash to different workers, which
+        # have to agree on its master and trunks
+        if self.config.bridge_registry != CONSUL_REGISTRY:
+            raise ValueError("%d workers require the consul bridge registry"
+                             % self.config.workers)
+
+        pool = WorkerPool(self, self.config.workers)
+        pool.start()
+
+        loop = asyncio.get_event_loop()
+        queue = self.create_event_queue()
 
-        api_task = loop.create_task(self.run_api())
-        register_task = loop.create_task(self.register_consul(loop))
+        loop.run_until_complete(pool.connect())
 
+        tasks = self.create_bus_tasks(loop, queue)
+        tasks.append(loop.create_task(pool.supervise()))
         try:
-            loop.run_until_complete(api_task)
+            self.run_until_complete(
+                loop, loop.create_task(self.route_msgs(queue, pool)), tasks)
         finally:
-            register_task.cancel()
-
-            if self.register:
-                ari_register_task.cancel()
+            pool.stop()
+
+    def run_worker(self, index, sock, api_sock):
+        # fresh loop and HTTP session, nothing of the parent loop is usable
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        self.worker_index = index
+        self.setup_ari()
+
+        queue = self.create_event_queue()
+
+        tasks = [
+            loop.create_task(read_forwarded(sock, queue)),
+            loop.create_task(self.process_msgs(queue)),
+            loop.create_task(self.sweep_contexts()),
+            loop.create_task(self.catalog.run(loop)),
+            loop.create_task(self.bridge_registry.run(loop)),
+        ]
+
+        self.run_until_complete(
+            loop, loop.create_task(self.run_api(api_sock)), tasks)
+
+    def create_event_queue(self):
+        size = self.config.events_queue_size
+
+        # messages are acknowledged once processed, the broker never
+        # delivers more than the prefetch window so the watermarks have to
+        # fit in it to ever be reached
+        window = size
+        if (self.config.events_transport == AMQP_TRANSPORT and
+                self.worker_index is None and self.config.amqp_prefetch):
+            window = min(size, self.config.amqp_prefetch)
+            if window < size:
+                logger.info("Event queue watermarks relative to the AMQP "
+                            "prefetch (%d)" % window)
+
+        # a small window must not pause and resume on every message
+        high = max(1, int(window * self.config.events_high_watermark))
+        low = min(int(window * self.config.events_low_watermark), high - 1)
+
+        queue = EventQueue(size, high, low,
+                           self._on_high_watermark, self._on_low_watermark)
+        self.event_queue = queue
+        self.consume_lock = asyncio.Lock()
+        self.connection_lost = asyncio.Event()
+
+        return queue
+
+    def create_bus_tasks(self, loop, queue):
+        tasks = [
+            loop.create_task(self.catalog.run(loop)),
+            loop.create_task(self.registration.run(loop)),
+        ]
+
+        if self.config.events_transport == WEBSOCKET_TRANSPORT:
+            transport = WebSocketTransport(self, queue)
+            tasks.append(loop.create_task(transport.run(loop)))
+            return tasks
+
+        tasks.append(loop.create_task(self.reconnector(loop, queue)))
 
-            reconnect_task.cancel()
-            process_msgs_task.cancel()
+        # mainly for dev or debug purpose when not using consul
+        if self.register:
+            registrations = AriRegistrations(self)
+            tasks.append(loop.create_task(registrations.run(loop)))
 
-            loop.run_until_complete(register_task)
+        return tasks
 
-            if self.register:
-                loop.run_until_complete(ari_register_task)
+    def run_until_complete(self, loop, main_task, tasks):
+        try:
+            loop.run_until_complete(main_task)
+        finally:
+            for task in tasks:
+                task.cancel()
 
-            loop.run_until_complete(reconnect_task)
-            loop.run_until_complete(process_msgs_task)
+            for task in tasks:
+                loop.run_until_complete(task)
 
             loop.close()
 
-    async def run_api(self):
+    async def run_api(self, sock=None):
         try:
             self.fastapi.get("/status")(self.status)
+            self.fastapi.get("/breakers")(self.breakers)
+            self.fastapi.get("/metrics")(self.render_metrics)
 
             config = uvicorn.Config(self.fastapi,
                                     host="0.0.0.0", port=self.config.port)
 
             server = uvicorn.Server(config)
 
-            await server.serve()
+            if sock:
+                await server.serve(sockets=[sock])
+            else:
+                await server.serve()
         except asyncio.CancelledError:
             pass
 
     async def status(self):
-        return {'state': 'ok'}
+        return {'state': 'ok',
+                'overloaded': self.overloaded,
+                'queue': self.event_queue.qsize() if self.event_queue else 0,
+                'worker': self.worker_index,
+                'contexts': len(self.contextes),
+                'dispatch': self.dispatcher.depths(),
+                'amqp': self.amqp_stats,
+                'dropped_events': self.dropped_events}
+
+    def load(self):
+        return {'queue': self.event_queue.qsize() if self.event_queue else 0,
+                'contexts': len(self.contextes),
+                'overloaded': self.overloaded}
+
+    async def render_metrics(self):
+        return Response(content=self.metrics.render(),
+                        media_type="text/plain; version=0.0.4")
+
+    async def breakers(self):
+        return self.ari_policy.status()
 
     async def connect_and_consume(self, queue):
         connection = await asynqp.connect(
@@ -202,17 +556,42 @@ class Application(BridgeMixin, ChannelMixin, MediaMixin):
             password=self.config.amqp_password)
         try:
             channel = await connection.open_channel()
+
+            # bound the number of unacknowledged messages in flight
+            if self.config.amqp_prefetch:
+                await channel.set_qos(
+                    prefetch_count=self.config.amqp_prefetch)
+
             exchange = await channel.declare_exchange(
                 self.config.amqp_exchange, 'topic')
 
             amqp_queue = await channel.declare_queue(self.id)
-            
-            # NOTE(safchain) need to find a better binding thing
-            # so that not all application receive all messages
-            await amqp_queue.bind(exchange, '#')
 
-            consumer = Consumer(queue)
-            await amqp_queue.consume(consumer)
+            # Asterisk publishes the events of a Stasis application with a
+            # routing key derived from its name, binding on it avoids
+            # receiving and decoding the events of all the other
+            # applications of the cluster
+            for routing_key in binding_keys(self.config, self.name,
+                                            self.events.types()):
+                logger.info("Binding queue %s with %s" %
+                            (self.id, routing_key))
+                await amqp_queue.bind(exchange, routing_key)
+
+            # AMQP has no way to list the bindings, binding again an existing
+            # one is a no-op that gives the handle to remove it
+            for routing_key in stale_binding_keys(self.config, self.name,
+                                                  self.events.types()):
+                logger.info("Unbinding queue %s from %s" %
+                            (self.id, routing_key))
+                binding = await amqp_queue.bind(exchange, routing_key)
+                await binding.unbind()
+
+            async with self.consume_lock:
+                self.amqp_queue = amqp_queue
+                self.amqp_consumer = None
+                if not self.overloaded:
+                    self.amqp_consumer = await amqp_queue.consume(
+                        Consumer(queue, self._on_connection_lost))
 
         except asynqp.AMQPError as err:
             logger.error("Could not consume on queue %s" % err)
@@ -221,170 +600,277 @@ class Application(BridgeMixin, ChannelMixin, MediaMixin):
         return connection
 
     async def reconnector(self, loop, queue):
+        backoff = Backoff(RECONNECT_RATE, RECONNECT_MAX_DELAY)
+        connection = None
+        lost_at = None
         try:
-            connection = None
             while True:
-                if connection is None or connection.is_closed():
-                    logger.info("Connecting to rabbitmq...")
-                    try:
-                        connection = await self.connect_and_consume(queue)
-                    except (ConnectionError, OSError):
-                        logger.error("Failed to connect to rabbitmq server. "
-                                     "Will retry in {} seconds".format(RECONNECT_RATE))
-                        connection = None
-                    if connection is None:
-                        await asyncio.sleep(RECONNECT_RATE)
-                    else:
-                        logger.info("Successfully connected and consuming")
-
-                await asyncio.sleep(0.1)
-        except asyncio.CancelledError:
-            if connection is not None:
-                await connection.close()
+                logger.info("Connecting to rabbitmq...")
+                self.connection_lost.clear()
+                try:
+                    connection = await self.connect_and_consume(queue)
+                except (ConnectionError, OSError):
+                    logger.error("Failed to connect to rabbitmq server")
+                    connection = None
+
+                if connection is None:
+                    delay = backoff.next()
+                    logger.error("Will retry in %.1f seconds" % delay)
+                    await asyncio.sleep(delay)
+                    continue
 
-    async def process_msgs(self, queue):
+                logger.info("Successfully connected and consuming")
+                backoff.reset()
 
-        type_state_cb = {
-            'StasisStart/Ring': self.on_start,
-            'StasisStart/Up': self.on_up,
-            'ChannelStateChange/Up': self.on_up,
-            'StasisEnd/Up': self.on_end
-        }
+                self.amqp_stats['connected'] = True
+                if lost_at is not None:
+                    recovery = loop.time() - lost_at
+                    self.amqp_stats['last_recovery_time'] = recovery
+                    self.amqp_stats['total_recovery_time'] += recovery
+                    logger.info("Recovered from connection loss in %.1f "
+                                "seconds" % recovery)
 
-        try:
-            while True:
-                msg = await queue.get()
+                # woken up by the Consumer when the connection is lost
+                await self.connection_lost.wait()
 
-                try:
-                    obj = json.loads(msg.body)
-                except Exception as e:
-                    logger.error("Error while decoding AMQP message: %s" % e)
-                    continue
+                lost_at = loop.time()
+                self.amqp_stats['connected'] = False
+                self.amqp_stats['reconnects'] += 1
 
-                asterisk_id = obj.get('asterisk_id', '')
+                await self._close_connection(connection)
+                connection = None
 
-                type = obj.get('type', '')
-             
-                channel = Channel(obj.get('channel', {}))
+                # spread the reconnections of all the instances after a
+                # broker restart
+                await asyncio.sleep(backoff.next())
+        except asyncio.CancelledError:
+            if connection is not None:
+                await self._close_connection(connection)
 
-                # NOTE(safchain) this should probably done at the bus level
-                if channel.app_name != self.id:
-                    continue
+    async def _close_connection(self, connection):
+        try:
+            await connection.close()
+        except Exception as e:
+            logger.debug("Error while closing AMQP connection : %s" % e)
+
+    def _on_connection_lost(self, exc):
+        self.amqp_queue = None
+        self.amqp_consumer = None
+        self.connection_lost.set()
+
+    def _on_high_watermark(self):
+        self.overloaded = True
+        asyncio.ensure_future(self._sync_consuming())
+        asyncio.ensure_future(self.on_high_watermark())
+
+    def _on_low_watermark(self):
+        self.overloaded = False
+        asyncio.ensure_future(self._sync_consuming())
+        asyncio.ensure_future(self.on_low_watermark())
+
+    async def _sync_consuming(self):
+        # pause the consumption while overloaded, messages then stay on the
+        # broker instead of piling up in memory
+        async with self.consume_lock:
+            try:
+                if self.overloaded and self.amqp_consumer:
+                    logger.warning("Pausing consumption of queue %s" %
+                                   self.id)
+                    await self.amqp_consumer.cancel()
+                    self.amqp_consumer = None
+                elif (not self.overloaded and self.amqp_consumer is None and
+                      self.amqp_queue):
+                    logger.info("Resuming consumption of queue %s" % self.id)
+                    self.amqp_consumer = await self.amqp_queue.consume(
+                        Consumer(self.event_queue, self._on_connection_lost))
+            except (asynqp.AMQPError, ConnectionError, OSError) as e:
+                logger.error("Could not change queue consumption : %s" % e)
+                # no consumer to notice it while paused
+                self._on_connection_lost(e)
 
-                context = Context(asterisk_id, channel)
-                context = self.contextes.get(context, context)
+    async def process_msgs(self, queue):
+        self.dispatcher.start()
+        try:
+            while True:
+                msgs = [await queue.get()]
 
-                if type == "StasisStart":
-                    self.contextes[context] = context
-                elif type == "StasisEnd":
-                    self.contextes.pop(context, None)
+                # drain what is already there so that the whole batch gets
+                # acknowledged with a single frame
+                while (len(msgs) < self.config.amqp_ack_batch and
+                       not queue.empty()):
+                    msgs.append(queue.get_nowait())
 
-                key = "%s/%s" % (type, channel.state)
-                callback = type_state_cb.get(key)
-                if callback:
-                    await callback(context)
+                for msg in msgs:
+                    try:
+                        await self.process_msg(msg)
+                    except Exception as e:
+                        logger.error("Error while processing message: %s" % e)
 
-                msg.ack()
+                ack(msgs)
         except asyncio.CancelledError:
-            pass
+            await self.dispatcher.stop()
 
-    async def register_consul(self, loop):
-        app_registered = False
+    async def route_msgs(self, queue, pool):
         try:
-            c = consul.aio.Consul(
-                host=self.config.consul_host,
-                port=self.config.consul_port, loop=loop)
-
-            revision = 1
             while True:
-                try:
-                    logger.info(
-                        "Registering application %s in Consul" % self.name)
-                    if not app_registered:
-                        response = await c.kv.put("applications/%s" % self.name,
-                                                  "%d" % revision)
-                        if response is not True:
-                            raise Exception(
-                                "error",
-                                "registering application %s" % self.name)
-                        app_registered = True
-
-                    service_id = "apps/%s" % self.id
-                    service_name = self.name
-
-                    response = await c.agent.service.register(
-                        service_name, service_id=service_id,
-                        address=self.config.host, port=self.config.port,
-                    )
-                    if response is not True:
-                        raise Exception("error",
-                                        "registering service %s" % self.name)
-
-                    status_url = "http://%s:%d/status" % (
-                        self.config.host, self.config.port)
-                    response = await c.agent.check.register(
-                        self.name, consul.Check.http(status_url, '5s'),
-                        service_id=service_id)
-                    if response is not True:
-                        raise Exception("error",
-                                        "registering check %s" % self.name)
-
-                    logger.info(
-                        "Service check %s registered in Consul" % self.name)
-
-                    revision += 1
-                except Exception as e:
-                    logger.error("Consul error: %s", e)
-
-                await asyncio.sleep(5)
+                msgs = [await queue.get()]
+                while (len(msgs) < self.config.amqp_ack_batch and
+                       not queue.empty()):
+                    msgs.append(queue.get_nowait())
+
+                for msg in msgs:
+                    try:
+                        await self.route_msg(msg, pool)
+                    except Exception as e:
+                        logger.error("Error while routing message: %s" % e)
+
+                ack(msgs)
         except asyncio.CancelledError:
             pass
 
-    async def register_all_ari(self, loop):
+    async def route_msg(self, msg, pool):
+        if self.prefilter and not self.prefilter(msg.body):
+            return
+
         try:
-            c = consul.aio.Consul(
-                host=self.config.consul_host,
-                port=self.config.consul_port, loop=loop)
+            obj = self.decode(msg.body)
+        except Exception as e:
+            logger.error("Error while decoding AMQP message: %s" % e)
+            return
+
+        if obj.get('type', '') not in self.events:
+            self.dropped_events[obj.get('type', '')] += 1
+            return
+
+        channel = obj.get('channel')
+        if channel is None and obj.get('bridge') is not None:
+            # every worker caches the bridges it uses
+            await pool.broadcast(msg.body)
+            return
+
+        # channel affinity, the channels originated by a worker go back to
+        # it as it is the one knowing them
+        channel_id = (channel or {}).get('id', '')
+        index = originating_worker(channel_id)
+        if index is not None and index < pool.count:
+            await pool.send(index, msg.body)
+        else:
+            await pool.forward(channel_id, msg.body)
+
+    async def process_msg(self, msg):
+        if self.prefilter and not self.prefilter(msg.body):
+            return
 
-            while True:
-                (_, nodes) = await c.health.service("asterisk")
-                for node in nodes:
-                    service = node.get("Service", {})
-                    meta = service.get("Meta", {})
-                    eid = meta.get("eid")
+        try:
+            obj = self.decode(msg.body)
+        except Exception as e:
+            logger.error("Error while decoding AMQP message: %s" % e)
+            return
+
+        type = obj.get('type', '')
+        self.events_received.labels(type).inc()
+
+        # drop what nobody listens to before allocating anything
+        if type not in self.events:
+            self.drop_event(type, obj)
+            return
+
+        asterisk_id = obj.get('asterisk_id', '')
+
+        channel = obj.get('channel')
+        if channel is None:
+            if obj.get('application') != self.id:
+                return
+
+            key = (asterisk_id, type)
+            for callback in self.events.handlers(type):
+                await self.dispatcher.dispatch(key, callback, None, obj)
+            return
+
+        # handled in other states only, StasisStart and StasisEnd still
+        # maintain the contexts
+        handlers = self.events.handlers(type, channel.get('state'))
+        if not handlers and type not in ("StasisStart", "StasisEnd"):
+            self.drop_event(type, obj)
+            return
+
+        channel = Channel(channel, self.config.channel_extras)
+
+        # NOTE(safchain) done at the bus level unless the legacy
+        # wildcard binding is used
+        if channel.app_name != self.id:
+            return
+
+        context = Context(asterisk_id, channel)
+        context = self.contextes.get(context, context)
+
+        if type == "StasisStart":
+            self.contextes[context] = context
+        elif type == "StasisEnd":
+            self.contextes.pop(context, None)
+        else:
+            self.contextes.touch(context)
+
+        for callback in handlers:
+            await self.dispatcher.dispatch(context, callback, context, obj)
+
+    def drop_event(self, type, obj):
+        self.dropped_events[type] += 1
+
+        # the channel is still there, its context must not expire
+        channel = obj.get('channel')
+        if channel is not None:
+            self.contextes.touch((obj.get('asterisk_id', ''),
+                                  channel.get('id')))
+
+    async def sweep_contexts(self):
+        if not self.contextes.ttl:
+            return
 
-                    if eid:
-                        await self.register_ari(eid)
+        try:
+            while True:
+                await asyncio.sleep(self.config.contexts_sweep_interval)
 
-                await asyncio.sleep(5)
+                for context in self.contextes.expire():
+                    logger.warning("Context %s expired without StasisEnd" %
+                                   context)
+                    await self.dispatcher.dispatch(context, self._on_expired,
+                                                   context)
         except asyncio.CancelledError:
             pass
 
     async def register_ari(self, asterisk_id):
-        while True:
-            # NOTE this will change in order to make a call toward consul
-            if asterisk_id:
-                logger.info(
-                    "Registering application %s on %s" %
+        logger.info("Registering application %s on %s" %
                     (self.name, asterisk_id))
-            else:
-                logger.info("Registering application %s" % self.name)
 
-            try:
-                amqp_api = swagger_client.AmqpApi(self.api_client)
-                await amqp_api.amqp_app_name_post(
-                    self.name, x_asterisk_id=asterisk_id)
+        await self.ari_call(
+            'amqp_register', asterisk_id,
+            self.ari.amqp.amqp_app_name_post, self.name, idempotent=True)
 
-                logger.info("Registered application %s" % self.name)
-            except Exception as e:
-                logger.error("Error while registering application %s : %s" % (
-                    self.name, e))
-
-            await asyncio.sleep(5)
+        logger.info("Registered application %s on %s" %
+                    (self.name, asterisk_id))
 
     def run(self):
         pass
 
+    @event_handler('StasisStart', 'Ring')
+    async def _on_start(self, context, event):
+        await self.on_start(context)
+
+    @event_handler('StasisStart', 'Up')
+    @event_handler('ChannelStateChange', 'Up')
+    async def _on_up(self, context, event):
+        await self.on_up(context)
+
+    # whatever the state the channel ends in, as its context is released
+    @event_handler('StasisEnd')
+    async def _on_end(self, context, event):
+        await self.on_end(context)
+
+    async def _on_expired(self, context):
+        await self._release_participant(context)
+        await self.on_expired(context)
+
     async def on_start(self, context):
         pass
 
@@ -393,3 +879,17 @@ class Application(BridgeMixin, ChannelMixin, MediaMixin):
 
     async def on_up(self, context):
         pass
+
+    async def on_expired(self, context):
+        """Called when a context got no event for contexts.ttl seconds, its
+        StasisEnd is not going to come."""
+        pass
+
+    async def on_high_watermark(self):
+        """Called when the event queue gets overloaded, the consumption is
+        paused until on_low_watermark, `self.overloaded` can be checked to
+        reject new calls in the meantime."""
+        pass
+
+    async def on_low_watermark(self):
+        pass
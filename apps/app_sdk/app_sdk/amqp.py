@@ -0,0 +1,68 @@
+import logging
+from asynqp import spec
+
+logger = logging.getLogger(__name__)
+
+# binding modes
+APPLICATION_BINDING = 'application'
+WILDCARD_BINDING = 'wildcard'
+
+
+def binding_keys(config, app_name, event_types=None):
+    """Return the routing keys an application queue has to be bound with.
+
+    In `application` mode the keys are built from `config.amqp_routing_key`,
+    `{app}` being replaced by the application name and `{type}` by each of
+    the `config.amqp_event_types`, by default the `event_types` handled by
+    the application, or by the `*` topic word. The `wildcard` mode keeps
+    the legacy `#` binding where every application receives every Stasis
+    event of the cluster.
+    """
+    if config.amqp_binding == WILDCARD_BINDING:
+        return ['#']
+
+    template = config.amqp_routing_key
+    if '{type}' not in template:
+        return [template.format(app=app_name)]
+
+    types = config.amqp_event_types or event_types or ['*']
+    return [template.format(app=app_name, type=type) for type in types]
+
+
+def stale_binding_keys(config, app_name, event_types=None):
+    """Return the routing keys of the other binding modes to remove from an
+    application queue.
+
+    The queue is durable and named after the application, the bindings of a
+    previous configuration, like the legacy `#` one, would otherwise keep
+    routing all the events to it.
+    """
+    if config.amqp_binding == WILDCARD_BINDING:
+        return []
+
+    keys = binding_keys(config, app_name, event_types)
+    stale = ['#']
+    if '{type}' in config.amqp_routing_key:
+        stale.append(config.amqp_routing_key.format(app=app_name, type='*'))
+    return [key for key in stale if key not in keys]
+
+
+def ack(msgs):
+    """Acknowledge a batch of messages with one frame per AMQP channel.
+
+    The messages have to be in delivery order. Messages received on the
+    same channel are acknowledged at once by a multiple-ack of the last
+    delivery tag, a batch can span several channels after a reconnection.
+    """
+    last = dict()
+    for msg in msgs:
+        last[msg.sender] = msg
+
+    for (sender, msg) in last.items():
+        if sender is None:
+            # already acknowledged by the process that consumed it
+            continue
+        if msg is msgs[0]:
+            msg.ack()
+        else:
+            sender.send_method(spec.BasicAck(msg.delivery_tag, True))
@@ -0,0 +1,85 @@
+import aiohttp
+import asyncio
+import logging
+import swagger_client
+from swagger_client import Configuration
+
+logger = logging.getLogger(__name__)
+
+# ARI request routing
+GATEWAY_ROUTING = 'gateway'
+DIRECT_ROUTING = 'direct'
+
+
+class AriClient:
+    """Long-lived ARI API objects sharing one HTTP connection pool.
+
+    The default pool of the generated client only allows 4 connections and
+    no timeout below 5 minutes, the session is replaced by one built from
+    the `api_*` settings of the config.
+    """
+
+    def __init__(self, config, catalog=None):
+        configuration = Configuration()
+        configuration.host = "%s/ari" % config.api_endpoint
+        configuration.username = config.api_username
+        configuration.password = config.api_password
+
+        self.api_client = swagger_client.ApiClient(configuration)
+        self.setup_pool(self.api_client.rest_client, config)
+        if config.api_routing == DIRECT_ROUTING and catalog is not None:
+            self.setup_direct_routing(self.api_client.rest_client, config,
+                                      catalog)
+
+        self.channels = swagger_client.ChannelsApi(self.api_client)
+        self.bridges = swagger_client.BridgesApi(self.api_client)
+        self.amqp = swagger_client.AmqpApi(self.api_client)
+
+    def setup_pool(self, rest_client, config):
+        connector = aiohttp.TCPConnector(
+            limit=config.api_pool_size,
+            limit_per_host=config.api_pool_size_per_host,
+            keepalive_timeout=config.api_keepalive)
+
+        default = rest_client.pool_manager
+        rest_client.pool_manager = aiohttp.ClientSession(connector=connector)
+        # nothing has been sent yet, closing it does not wait for anything
+        asyncio.ensure_future(default.close())
+
+        timeout = aiohttp.ClientTimeout(
+            total=config.api_timeout, connect=config.api_connect_timeout)
+        request = rest_client.request
+
+        # the generated client passes its own 5 minutes timeout to every
+        # request unless one is given
+        async def request_with_timeout(*args, _request_timeout=None,
+                                       **kwargs):
+            return await request(*args,
+                                 _request_timeout=_request_timeout or timeout,
+                                 **kwargs)
+
+        rest_client.request = request_with_timeout
+
+    def setup_direct_routing(self, rest_client, config, catalog):
+        """Send the requests straight to the Asterisk of their
+        X-Asterisk-ID instead of through the api-gateway, falling back to
+        the gateway for an Asterisk not in the catalog."""
+        gateway = "%s/ari" % config.api_endpoint
+        request = rest_client.request
+
+        async def routed_request(method, url, *args, headers=None, **kwargs):
+            if headers and url.startswith(gateway):
+                for (name, eid) in headers.items():
+                    if name.lower() != 'x-asterisk-id':
+                        continue
+                    node = catalog.get(eid)
+                    if node:
+                        url = "http://%s:%d/ari%s" % (
+                            node.address, config.api_asterisk_port,
+                            url[len(gateway):])
+                    break
+
+            return await request(method, url, *args, headers=headers,
+                                 **kwargs)
+
+        rest_client.request = routed_request
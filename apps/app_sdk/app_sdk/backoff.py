@@ -0,0 +1,24 @@
+import random
+
+
+class Backoff:
+    """Exponential backoff with jitter.
+
+    Delays double from `base` up to `cap` seconds, half of each delay being
+    randomized so that many instances losing the same server do not all
+    come back at the same time.
+    """
+
+    def __init__(self, base=1, cap=30, factor=2):
+        self.base = base
+        self.cap = cap
+        self.factor = factor
+        self.attempts = 0
+
+    def next(self):
+        delay = min(self.cap, self.base * self.factor ** self.attempts)
+        self.attempts += 1
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def reset(self):
+        self.attempts = 0
@@ -0,0 +1,42 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class EventQueue(asyncio.Queue):
+    """Bounded queue between the AMQP consumer and process_msgs.
+
+    `on_high` is called once the fill level reaches `high`, `on_low` once
+    it went back down to `low`, so that the consumption can be paused in
+    between instead of letting the queue, and the latency, grow.
+    """
+
+    def __init__(self, maxsize, high, low, on_high, on_low):
+        super(EventQueue, self).__init__(maxsize)
+
+        self.high = high
+        self.low = low
+        self.on_high = on_high
+        self.on_low = on_low
+
+        self.above_high = False
+
+    def _put(self, item):
+        super(EventQueue, self)._put(item)
+
+        if not self.above_high and self.qsize() >= self.high:
+            self.above_high = True
+            logger.warning("Event queue reached high watermark (%d)" %
+                           self.high)
+            self.on_high()
+
+    def _get(self):
+        item = super(EventQueue, self)._get()
+
+        if self.above_high and self.qsize() <= self.low:
+            self.above_high = False
+            logger.info("Event queue back to low watermark (%d)" % self.low)
+            self.on_low()
+
+        return item
@@ -1,81 +1,346 @@
 import asyncio
+import contextlib
 import logging
-import consul.aio
-import swagger_client
 from swagger_client.rest import ApiException
 
+from app_sdk.bridge_registry import create_bridge_registry
+from app_sdk.coalesce import Coalescer
+from app_sdk.events import event_handler
+from app_sdk.topology import TreeTopology
+from app_sdk.workers import originated_channel_id
+
 logger = logging.getLogger(__name__)
 
 
 class BridgeMixin:
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, config, id, name, *args, **kwargs):
         super(BridgeMixin, self).__init__()
 
-        self.master_bridges = dict()
-        self.dial_bridges = set()
+        # master Asterisk of the bridges and the trunks to them
+        self.bridge_registry = create_bridge_registry(config, name)
+        # trunks being dialed by this process, by (bridge, asterisk)
+        self.trunk_dials = dict()
+        # bridge of the participants, by (asterisk, channel), and the locks
+        # serializing their join and leave, by (bridge, asterisk)
+        self.bridge_channels = dict()
+        self.bridge_locks = dict()
+
+        # trunks to the tree parent instead of the master for large bridges
+        self.topology = TreeTopology(config.mesh_fanout)
+        self.topology_nodes = set()
+        # extension dialed by the trunks of a bridge and type of the bridge
+        self.bridge_extens = dict()
+        self.bridge_types = dict()
+
+        # bridges known to exist, by (asterisk, bridge), and the lookups in
+        # progress
+        self.known_bridges = dict()
+        self.bridge_lookups = dict()
+
+        # channels joining a bridge at the same time are added at once
+        self.bridge_adds = Coalescer(self._bridge_add_channels,
+                                     config.bridge_add_window)
+
+    async def get_or_create_bridge(self, context, id, type, extension=None):
+        """Get or create the bridge on the Asterisk of the context and
+        trunk it to the other Asterisk of the bridge.
+
+        The trunks dial `extension`, by default the one of the channel, which
+        has to lead back to the same bridge on the other Asterisk.
+        """
+        self.bridge_types.setdefault(id, type)
+
+        bridge = self.known_bridges.get((context.asterisk_id, id))
+        if bridge is None:
+            bridge = await self._lookup_bridge(context.asterisk_id, id, type)
+            if bridge is None:
+                return
 
-    async def get_or_create_bridge(self, context, id, type):
-        bridges_api = swagger_client.BridgesApi(self.api_client)
+        # NOTE(safchain) all the mesh thing and the "master" thing
+        # should be moved to a dedicated component, api-gateway ?
         try:
-            bridge = await bridges_api.bridges_bridge_id_get(
-                id, x_asterisk_id=context.asterisk_id)
+            await self._mesh(context, id, extension)
+        except Exception as e:
+            logger.error("Error while meshing bridge %s on %s : %s" %
+                         (id, context.asterisk_id, e))
 
-            logger.info("Bridge %s found on %s" % (id, context.asterisk_id))
+        return bridge
 
-            # NOTE(safchain) all the mesh thing and the "master" thing
-            # should be moved to a dedicated component, api-gateway ?
-            if id not in self.master_bridges:
-                self.master_bridges[id] = context.asterisk_id
-            else:
-                await self._mesh(context, id)
+    async def _lookup_bridge(self, asterisk_id, id, type):
+        # callers of the same bridge arriving together share the calls
+        key = (asterisk_id, id)
+        lookup = self.bridge_lookups.get(key)
+        if lookup is None:
+            lookup = asyncio.ensure_future(
+                self._get_or_create_bridge(asterisk_id, id, type))
+            self.bridge_lookups[key] = lookup
+            lookup.add_done_callback(
+                lambda _: self.bridge_lookups.pop(key, None))
 
-            return bridge
+        return await asyncio.shield(lookup)
+
+    async def _get_or_create_bridge(self, asterisk_id, id, type):
+        bridge = None
+        try:
+            bridge = await self.ari_call(
+                'bridge_get', asterisk_id,
+                self.ari.bridges.bridges_bridge_id_get, id, idempotent=True)
+
+            logger.info("Bridge %s found on %s" % (id, asterisk_id))
         except ApiException:
             pass
+        except Exception as e:
+            logger.error("Error while getting bridge on %s : %s" %
+                         (asterisk_id, e))
+            return
 
-        try:
-            bridge = await bridges_api.bridges_bridge_id_post(
-                id, type=type, x_asterisk_id=context.asterisk_id)
+        if bridge is None:
+            try:
+                bridge = await self.ari_call(
+                    'bridge_create', asterisk_id,
+                    self.ari.bridges.bridges_bridge_id_post, id, type=type,
+                    idempotent=True)
 
-            logger.info("Created bridge %s on %s" % (id, context.asterisk_id))
+                logger.info("Created bridge %s on %s" % (id, asterisk_id))
+            except Exception as e:
+                logger.error("Error while creating bridge on %s : %s" %
+                             (asterisk_id, e))
+                return
 
-            # NOTE(safchain) see upper comment
-            if id not in self.master_bridges:
-                self.master_bridges[id] = context.asterisk_id
-            else:
-                await self._mesh(context, id)
+        self.known_bridges[(asterisk_id, id)] = bridge
+        return bridge
 
-            return bridge
-        except ApiException as e:
-            logger.error("Error while creating bridge on %s : %s" %
-                         (context.asterisk_id, e))
+    @event_handler('BridgeDestroyed')
+    async def _on_bridge_destroyed(self, context, event):
+        id = (event.get('bridge') or {}).get('id')
+        if self.known_bridges.pop((event.get('asterisk_id'), id), None):
+            logger.info("Bridge %s destroyed on %s" %
+                        (id, event.get('asterisk_id')))
+
+    def trunk_bridge(self, context):
+        """Bridge of the trunk channel of the context, None for any other
+        channel."""
+        key = self.bridge_registry.trunk_channels.get(context.channel.id)
+        return key[0] if key else None
 
-    async def _mesh(self, context, id):
-        master = self.master_bridges.get(id)
-        if not master:
+    async def _mesh(self, context, id, extension=None):
+        registry = self.bridge_registry
+
+        master = registry.master(id)
+        if master is None:
+            candidate = self.placement.choose(
+                id, context.asterisk_id, list(self.catalog.nodes.values()))
+            master = await registry.elect(id, candidate)
+
+        if registry.is_trunk(context.channel.id):
             return
 
-        if context.asterisk_id == master:
+        async with self._bridge_lock(id, context.asterisk_id):
+            key = (context.asterisk_id, context.channel.id)
+            if key not in self.bridge_channels:
+                self.bridge_channels[key] = id
+                await registry.add_participant(id, context.asterisk_id)
+
+            extension = extension or context.channel.exten
+            self.bridge_extens.setdefault(id, extension)
+            members = await registry.join(id, context.asterisk_id)
+            if context.asterisk_id == master:
+                return
+
+            parent = self.topology.parent(master, members,
+                                          context.asterisk_id)
+            await self._trunk(context.asterisk_id, id, parent, extension)
+
+    @contextlib.asynccontextmanager
+    async def _bridge_lock(self, id, asterisk_id):
+        key = (id, asterisk_id)
+        (lock, users) = self.bridge_locks.get(key, (asyncio.Lock(), 0))
+        self.bridge_locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            (lock, users) = self.bridge_locks[key]
+            if users > 1:
+                self.bridge_locks[key] = (lock, users - 1)
+            else:
+                del self.bridge_locks[key]
+
+    async def _release_participant(self, context):
+        """Uncount the channel of the context from its bridge, the Asterisk
+        left by its last participant hangs up its trunk and leaves the
+        bridge."""
+        id = self.bridge_channels.pop(
+            (context.asterisk_id, context.channel.id), None)
+        if id is None:
             return
 
-        if context.channel.id in self.dial_bridges:
+        registry = self.bridge_registry
+        async with self._bridge_lock(id, context.asterisk_id):
+            if await registry.remove_participant(id, context.asterisk_id):
+                return
+
+            await self._redial_trunk(context.asterisk_id, id, None)
+            relinks = await self._leave_bridge(id, [context.asterisk_id])
+        await self._relink(id, relinks)
+
+    async def _trunk(self, asterisk_id, id, parent, extension):
+        # the participants of an Asterisk share one trunk to its parent,
+        # the first one dials it, the others wait for it
+        key = (id, asterisk_id)
+        dial = self.trunk_dials.get(key)
+        if dial is None:
+            if self.bridge_registry.trunk(*key) is not None:
+                return
+
+            dial = asyncio.ensure_future(
+                self._dial_trunk(asterisk_id, id, parent, extension))
+            self.trunk_dials[key] = dial
+            dial.add_done_callback(lambda _: self.trunk_dials.pop(key, None))
+
+        await asyncio.shield(dial)
+
+    async def _dial_trunk(self, asterisk_id, id, parent, extension):
+        registry = self.bridge_registry
+        if not await registry.claim_trunk(id, asterisk_id):
             return
 
-        channel = await self._dial_asterisk(
-            context, master, context.channel.exten)
-        if channel:
-            self.dial_bridges.add(channel.id)
+        # known as a trunk before its StasisStart can come
+        channel_id = originated_channel_id(self.worker_index)
+        await registry.set_trunk(id, asterisk_id, channel_id)
+
+        channel = None
+        try:
+            channel = await self._dial_asterisk(asterisk_id, parent,
+                                                extension, channel_id)
+        finally:
+            if channel:
+                logger.info("Trunk %s of bridge %s from %s to %s" % (
+                    channel.id, id, asterisk_id, parent))
+            else:
+                await registry.release_trunk(id, asterisk_id)
+
+    def _on_nodes_change(self, nodes):
+        removed = self.topology_nodes - set(nodes)
+        self.topology_nodes = set(nodes)
+        if removed:
+            for key in [k for k in self.known_bridges if k[0] in removed]:
+                del self.known_bridges[key]
+            # their channels are gone without StasisEnd
+            for key in [k for k in self.bridge_channels if k[0] in removed]:
+                del self.bridge_channels[key]
+            asyncio.ensure_future(self._rebuild_topology(removed))
+
+    async def _rebuild_topology(self, removed):
+        """Remove the Asterisk that left from the bridges and redial the
+        trunks whose parent changed."""
+        registry = self.bridge_registry
+
+        for id in set(registry.members) | set(registry.masters):
+            members = registry.members.get(id, [])
+            # the master joins its members only once it gets a participant
+            leaving = removed.intersection(members + [registry.master(id)])
+            if leaving:
+                await self._relink(id, await self._leave_bridge(id, leaving))
+
+    async def _leave_bridge(self, id, leaving):
+        """Remove the Asterisk from the bridge, return the others whose
+        parent changed."""
+        registry = self.bridge_registry
+
+        before = self.topology.plan(registry.master(id),
+                                    registry.members.get(id, []))
+        for asterisk_id in leaving:
+            logger.info("Asterisk %s left bridge %s" % (asterisk_id, id))
+            await registry.leave(id, asterisk_id)
+
+        master = registry.master(id)
+        if master is None:
+            self.bridge_extens.pop(id, None)
+            self.bridge_types.pop(id, None)
+            return []
+
+        after = self.topology.plan(master, registry.members.get(id, []))
+        # a promoted master does not trunk anymore
+        return [asterisk_id for asterisk_id in [master] + list(after)
+                if before.get(asterisk_id) != after.get(asterisk_id)]
+
+    async def _relink(self, id, asterisk_ids):
+        registry = self.bridge_registry
+
+        for asterisk_id in asterisk_ids:
+            async with self._bridge_lock(id, asterisk_id):
+                # the topology may have changed again in the meantime
+                members = registry.members.get(id, [])
+                if asterisk_id not in members:
+                    continue
+                parent = self.topology.plan(registry.master(id),
+                                            members).get(asterisk_id)
+                await self._redial_trunk(asterisk_id, id, parent)
+
+    async def _redial_trunk(self, asterisk_id, id, parent):
+        registry = self.bridge_registry
+
+        channel_id = registry.trunk(id, asterisk_id)
+        if channel_id:
+            await registry.release_trunk(id, asterisk_id)
+            try:
+                await self.ari_call(
+                    'hangup', asterisk_id,
+                    self.ari.channels.channels_channel_id_delete, channel_id)
+            except Exception as e:
+                logger.error("Error while hanging up trunk %s : %s" %
+                             (channel_id, e))
+
+        extension = self.bridge_extens.get(id)
+        if parent and extension:
+            await self._trunk(asterisk_id, id, parent, extension)
+
+    @event_handler('StasisEnd')
+    async def _on_bridge_channel_end(self, context, event):
+        registry = self.bridge_registry
+
+        key = registry.trunk_channels.get(context.channel.id)
+        if key is None:
+            await self._release_participant(context)
+            return
+
+        logger.info("Trunk %s of bridge %s from %s ended" % (
+            context.channel.id, key[0], key[1]))
+        await registry.release_trunk(*key)
 
     async def bridge_add_channel(self, context, id):
         try:
-            bridges_api = swagger_client.BridgesApi(self.api_client)
-            await bridges_api.bridges_bridge_id_add_channel_post(
-                id, [context.channel.id],
-                x_asterisk_id=context.asterisk_id)
+            await self.bridge_adds.add((context.asterisk_id, id),
+                                       context.channel.id)
 
             logger.info("Added channel %s to bridge %s on %s" %
                         (context.channel.id, id, context.asterisk_id))
         except Exception as e:
             logger.error("Error while add a channel to bridge %s : %s" %
                          (id, e))
+
+    async def _bridge_add_channels(self, key, channel_ids):
+        (asterisk_id, id) = key
+        try:
+            await self.ari_call(
+                'bridge_add_channel', asterisk_id,
+                self.ari.bridges.bridges_bridge_id_add_channel_post,
+                id, channel_ids, idempotent=True)
+        except ApiException as e:
+            if e.status != 404 or id not in self.bridge_types:
+                raise
+
+            # destroyed without its event reaching us, create it again
+            logger.warning("Bridge %s gone on %s, creating it again" %
+                           (id, asterisk_id))
+            self.known_bridges.pop(key, None)
+            if await self._lookup_bridge(asterisk_id, id,
+                                         self.bridge_types[id]) is None:
+                raise
+
+            await self.ari_call(
+                'bridge_add_channel', asterisk_id,
+                self.ari.bridges.bridges_bridge_id_add_channel_post,
+                id, channel_ids, idempotent=True)
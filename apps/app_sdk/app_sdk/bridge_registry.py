@@ -0,0 +1,347 @@
+import asyncio
+import consul.aio
+import json
+import logging
+
+from app_sdk.backoff import Backoff
+
+logger = logging.getLogger(__name__)
+
+MEMORY_REGISTRY = 'memory'
+CONSUL_REGISTRY = 'consul'
+
+
+def remove_member(master, members, asterisk_id):
+    """Remove the Asterisk from a bridge, return its new master and members.
+
+    The last joined Asterisk takes the place of the leaving one, at the root
+    of the topology tree for a leaving master, so that the place of all the
+    others stays the same. The master is kept otherwise.
+    """
+    others = [m for m in members if m != asterisk_id]
+    if not others:
+        return (None, [])
+
+    if asterisk_id == master:
+        master = others[-1]
+
+    members = list(members)
+    if asterisk_id in members:
+        index = members.index(asterisk_id)
+        last = members.pop()
+        if index < len(members):
+            members[index] = last
+    return (master, members)
+
+
+class MemoryBridgeRegistry:
+    """Master Asterisk of the bridges, Asterisk hosting them and trunks
+    between them, known only by this process.
+
+    A trunk is the channel dialed from an Asterisk of a bridge to its parent
+    in the topology, there is one per (bridge, Asterisk). Its channel id,
+    chosen by the dialing process, is empty until then. It is kept as long
+    as the Asterisk has participants in the bridge, trunks of its children
+    included.
+    """
+
+    def __init__(self):
+        self.masters = dict()
+        self.members = dict()
+        self.trunks = dict()
+        self.trunk_channels = dict()
+        self.participants = dict()
+
+    def master(self, bridge_id):
+        return self.masters.get(bridge_id)
+
+    async def elect(self, bridge_id, asterisk_id):
+        """Return the master of the bridge, `asterisk_id` if there was none
+        yet."""
+        return self.masters.setdefault(bridge_id, asterisk_id)
+
+    async def join(self, bridge_id, asterisk_id):
+        """Add the Asterisk to the ones hosting the bridge, return them in
+        joining order."""
+        members = self.members.setdefault(bridge_id, [])
+        if asterisk_id not in members:
+            members.append(asterisk_id)
+        return members
+
+    async def leave(self, bridge_id, asterisk_id):
+        """Remove the Asterisk from the bridge and release its trunk and
+        participants, a leaving master is replaced by the last joined
+        Asterisk."""
+        master = self.masters.get(bridge_id)
+        members = self.members.get(bridge_id, [])
+        if asterisk_id in members or asterisk_id == master:
+            self.set_members(bridge_id,
+                             *remove_member(master, members, asterisk_id))
+        await self.release_trunk(bridge_id, asterisk_id)
+        self.set_participants(bridge_id, asterisk_id, 0)
+
+    def set_members(self, bridge_id, master, members):
+        if members:
+            self.members[bridge_id] = members
+            self.masters[bridge_id] = master
+        else:
+            self.members.pop(bridge_id, None)
+            self.masters.pop(bridge_id, None)
+
+    def trunk(self, bridge_id, asterisk_id):
+        return self.trunks.get((bridge_id, asterisk_id))
+
+    def is_trunk(self, channel_id):
+        return channel_id in self.trunk_channels
+
+    async def claim_trunk(self, bridge_id, asterisk_id):
+        """Reserve the trunk of the remote Asterisk, False if it already
+        exists or is being dialed."""
+        key = (bridge_id, asterisk_id)
+        if key in self.trunks:
+            return False
+        self.trunks[key] = ''
+        return True
+
+    async def set_trunk(self, bridge_id, asterisk_id, channel_id):
+        self.trunks[(bridge_id, asterisk_id)] = channel_id
+        self.trunk_channels[channel_id] = (bridge_id, asterisk_id)
+
+    async def release_trunk(self, bridge_id, asterisk_id):
+        channel_id = self.trunks.pop((bridge_id, asterisk_id), None)
+        self.trunk_channels.pop(channel_id, None)
+
+    async def add_participant(self, bridge_id, asterisk_id):
+        """Count a channel of the Asterisk in the bridge, return the count."""
+        return self.set_participants(
+            bridge_id, asterisk_id,
+            self.participants.get((bridge_id, asterisk_id), 0) + 1)
+
+    async def remove_participant(self, bridge_id, asterisk_id):
+        """Uncount a channel of the Asterisk in the bridge, return the
+        count."""
+        return self.set_participants(
+            bridge_id, asterisk_id,
+            self.participants.get((bridge_id, asterisk_id), 0) - 1)
+
+    def set_participants(self, bridge_id, asterisk_id, count):
+        key = (bridge_id, asterisk_id)
+        if count > 0:
+            self.participants[key] = count
+        else:
+            count = 0
+            self.participants.pop(key, None)
+        return count
+
+    async def run(self, loop):
+        pass
+
+
+class ConsulBridgeRegistry(MemoryBridgeRegistry):
+    """Bridge registry shared by the instances of an application in the
+    Consul KV, under `bridges/<application>/`.
+
+    The first Asterisk written for a bridge wins, as the first instance
+    claiming a trunk, the writes are check-and-sets on a key that does not
+    exist yet. Reads are served from the local cache, kept up to date by a
+    blocking query on the prefix.
+    """
+
+    def __init__(self, config, name, wait='60s'):
+        super(ConsulBridgeRegistry, self).__init__()
+
+        self.config = config
+        self.prefix = "bridges/%s/" % name
+        self.wait = wait
+        self.consul = None
+
+    def client(self):
+        if self.consul is None:
+            self.consul = consul.aio.Consul(
+                host=self.config.consul_host,
+                port=self.config.consul_port,
+                loop=asyncio.get_event_loop())
+        return self.consul
+
+    async def elect(self, bridge_id, asterisk_id):
+        master = self.masters.get(bridge_id)
+        if master:
+            return master
+
+        c = self.client()
+        key = "%smasters/%s" % (self.prefix, bridge_id)
+        if await c.kv.put(key, asterisk_id, cas=0) is True:
+            master = asterisk_id
+        else:
+            (_, item) = await c.kv.get(key)
+            master = item['Value'].decode() if item else asterisk_id
+
+        self.masters[bridge_id] = master
+        return master
+
+    async def join(self, bridge_id, asterisk_id):
+        members = self.members.get(bridge_id)
+        if members and asterisk_id in members:
+            return members
+
+        c = self.client()
+        key = "%smembers/%s" % (self.prefix, bridge_id)
+        while True:
+            (_, item) = await c.kv.get(key)
+            members = json.loads(item['Value']) if item else []
+            if asterisk_id in members:
+                break
+
+            members.append(asterisk_id)
+            if await c.kv.put(key, json.dumps(members),
+                              cas=item['ModifyIndex'] if item else 0) is True:
+                break
+
+        self.members[bridge_id] = members
+        return members
+
+    async def leave(self, bridge_id, asterisk_id):
+        c = self.client()
+        key = "%smembers/%s" % (self.prefix, bridge_id)
+        master_key = "%smasters/%s" % (self.prefix, bridge_id)
+        while True:
+            (_, item) = await c.kv.get(key)
+            members = json.loads(item['Value']) if item else []
+            (_, master_item) = await c.kv.get(master_key)
+            master = master_item['Value'].decode() if master_item else None
+            if asterisk_id not in members and asterisk_id != master:
+                break
+
+            (new_master, new_members) = remove_member(master, members,
+                                                      asterisk_id)
+            if asterisk_id in members:
+                if new_members:
+                    removed = await c.kv.put(key, json.dumps(new_members),
+                                             cas=item['ModifyIndex'])
+                else:
+                    removed = await c.kv.delete(key, cas=item['ModifyIndex'])
+                if removed is not True:
+                    continue
+
+            if new_master != master:
+                if new_master:
+                    await c.kv.put(master_key, new_master)
+                else:
+                    await c.kv.delete(master_key)
+
+            self.set_members(bridge_id, new_master, new_members)
+            break
+
+        await self.release_trunk(bridge_id, asterisk_id)
+        await c.kv.delete(self.participants_key(bridge_id, asterisk_id))
+        self.set_participants(bridge_id, asterisk_id, 0)
+
+    def participants_key(self, bridge_id, asterisk_id):
+        return "%sparticipants/%s/%s" % (self.prefix, bridge_id, asterisk_id)
+
+    def trunk_key(self, bridge_id, asterisk_id):
+        return "%strunks/%s/%s" % (self.prefix, bridge_id, asterisk_id)
+
+    async def claim_trunk(self, bridge_id, asterisk_id):
+        if not await super(ConsulBridgeRegistry, self).claim_trunk(
+                bridge_id, asterisk_id):
+            return False
+
+        if await self.client().kv.put(self.trunk_key(bridge_id, asterisk_id),
+                                      "", cas=0) is True:
+            return True
+
+        # dialed by another instance, known with the next update
+        return False
+
+    async def set_trunk(self, bridge_id, asterisk_id, channel_id):
+        await super(ConsulBridgeRegistry, self).set_trunk(
+            bridge_id, asterisk_id, channel_id)
+        await self.client().kv.put(self.trunk_key(bridge_id, asterisk_id),
+                                   channel_id)
+
+    async def release_trunk(self, bridge_id, asterisk_id):
+        await super(ConsulBridgeRegistry, self).release_trunk(
+            bridge_id, asterisk_id)
+        await self.client().kv.delete(self.trunk_key(bridge_id, asterisk_id))
+
+    async def add_participant(self, bridge_id, asterisk_id):
+        return await self._count_participant(bridge_id, asterisk_id, 1)
+
+    async def remove_participant(self, bridge_id, asterisk_id):
+        return await self._count_participant(bridge_id, asterisk_id, -1)
+
+    async def _count_participant(self, bridge_id, asterisk_id, delta):
+        # the participants of an Asterisk may be spread over the instances
+        c = self.client()
+        key = self.participants_key(bridge_id, asterisk_id)
+        while True:
+            (_, item) = await c.kv.get(key)
+            count = max(0, (int(item['Value']) if item else 0) + delta)
+            if count:
+                done = await c.kv.put(key, str(count),
+                                      cas=item['ModifyIndex'] if item else 0)
+            elif item:
+                done = await c.kv.delete(key, cas=item['ModifyIndex'])
+            else:
+                done = True
+            if done is True:
+                break
+
+        return self.set_participants(bridge_id, asterisk_id, count)
+
+    def update(self, items):
+        masters = dict()
+        members = dict()
+        trunks = dict()
+        trunk_channels = dict()
+        participants = dict()
+        for item in items or []:
+            (kind, _, id) = item['Key'][len(self.prefix):].partition('/')
+            value = (item['Value'] or b'').decode()
+            if kind == 'masters' and value:
+                masters[id] = value
+            elif kind == 'members' and value:
+                members[id] = json.loads(value)
+            elif kind == 'trunks':
+                key = tuple(id.rsplit('/', 1))
+                trunks[key] = value
+                if value:
+                    trunk_channels[value] = key
+            elif kind == 'participants' and value:
+                participants[tuple(id.rsplit('/', 1))] = int(value)
+
+        self.masters = masters
+        self.members = members
+        self.trunks = trunks
+        self.trunk_channels = trunk_channels
+        self.participants = participants
+
+    async def run(self, loop):
+        try:
+            c = self.client()
+
+            index = None
+            backoff = Backoff()
+            while True:
+                try:
+                    (new_index, items) = await c.kv.get(
+                        self.prefix, index=index, recurse=True,
+                        wait=self.wait)
+                except Exception as e:
+                    logger.error("Consul error: %s", e)
+                    await asyncio.sleep(backoff.next())
+                    continue
+                backoff.reset()
+
+                if new_index != index:
+                    index = new_index
+                    self.update(items)
+        except asyncio.CancelledError:
+            pass
+
+
+def create_bridge_registry(config, name):
+    if config.bridge_registry == CONSUL_REGISTRY:
+        return ConsulBridgeRegistry(config, name)
+    return MemoryBridgeRegistry()
@@ -0,0 +1,90 @@
+import asyncio
+import collections
+import consul.aio
+import logging
+
+from app_sdk.backoff import Backoff
+
+logger = logging.getLogger(__name__)
+
+# index is the ModifyIndex of the service, changed by a new registration
+AsteriskNode = collections.namedtuple('AsteriskNode',
+                                      ['eid', 'address', 'port', 'meta',
+                                       'index'])
+
+
+class AsteriskCatalog:
+    """In-process cache of the Asterisk registered in Consul, by eid.
+
+    Fed by a blocking query on the health of the asterisk service, only the
+    Asterisk passing their checks are kept so that a crashed one leaves the
+    catalog. The listeners are called with the new nodes on every change.
+    """
+
+    def __init__(self, config, wait='60s'):
+        self.config = config
+        self.wait = wait
+        self.index = None
+        self.nodes = dict()
+        self.listeners = []
+
+    def get(self, eid):
+        return self.nodes.get(eid)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def update(self, nodes):
+        catalog = dict()
+        for node in nodes:
+            service = node.get("Service", {})
+            meta = service.get("Meta") or {}
+            eid = meta.get("eid")
+            if eid:
+                catalog[eid] = AsteriskNode(eid, service['Address'],
+                                            service['Port'], meta,
+                                            service.get('ModifyIndex'))
+
+        if catalog == self.nodes:
+            return
+        self.nodes = catalog
+
+        for listener in list(self.listeners):
+            try:
+                listener(catalog)
+            except Exception as e:
+                logger.error("Error in catalog listener %s : %s" %
+                             (listener, e))
+
+    async def run(self, loop):
+        try:
+            c = consul.aio.Consul(
+                host=self.config.consul_host,
+                port=self.config.consul_port, loop=loop)
+
+            backoff = Backoff()
+            while True:
+                try:
+                    (index, nodes) = await c.health.service(
+                        "asterisk", index=self.index, wait=self.wait,
+                        passing=True)
+                except Exception as e:
+                    logger.error("Consul error: %s", e)
+                    await asyncio.sleep(backoff.next())
+                    continue
+                backoff.reset()
+
+                # the index goes backward when the Consul state is reset
+                if (self.index is not None and index is not None and
+                        int(index) < int(self.index)):
+                    index = None
+                elif index == self.index:
+                    continue
+                self.index = index
+
+                self.update(nodes)
+        except asyncio.CancelledError:
+            pass
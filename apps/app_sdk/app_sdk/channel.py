@@ -1,40 +1,49 @@
-import asyncio
 import logging
-import consul.aio
-import swagger_client
-from swagger_client.rest import ApiException
+from types import MappingProxyType
+
+from app_sdk.workers import originated_channel_id
 
 logger = logging.getLogger(__name__)
 
 
+NO_EXTRAS = MappingProxyType({})
+
+
 class Channel:
+    """Fields of an ARI channel used by the SDK.
 
-    def __init__(self, obj):
-        self.obj = obj
+    Only the fields needed by the SDK are kept from the decoded event, any
+    other top-level field of the channel object has to be asked for through
+    `extras`, e.g. ('caller', 'channelvars').
+    """
 
-    @property
-    def dialplan(self):
-        return self.obj.get('dialplan', {})
+    __slots__ = ('id', 'state', 'exten', 'app_data', 'extras')
 
-    @property
-    def id(self):
-        return self.obj.get('id')
+    def __init__(self, obj, extras=()):
+        dialplan = obj.get('dialplan') or {}
 
-    @property
-    def state(self):
-        return self.obj.get('state')
+        self.id = obj.get('id')
+        self.state = obj.get('state')
+        self.exten = dialplan.get('exten')
+        self.app_data = dialplan.get('app_data')
+
+        self.extras = NO_EXTRAS
+        if extras:
+            self.extras = {k: obj[k] for k in extras if k in obj}
 
     @property
-    def raw(self):
-        return self.obj
+    def dialplan(self):
+        return {'exten': self.exten, 'app_data': self.app_data}
 
     @property
-    def exten(self):
-        return self.dialplan.get('exten')
+    def raw(self):
+        obj = dict(self.extras)
+        obj.update(id=self.id, state=self.state, dialplan=self.dialplan)
+        return obj
 
     @property
     def app_name(self):
-        return self.dialplan.get('app_data')
+        return self.app_data
 
 
 class ChannelMixin:
@@ -46,41 +55,54 @@ class ChannelMixin:
         logger.info("Answering call on channel : %s" % context)
 
         try:
-            channels_api = swagger_client.ChannelsApi(self.api_client)
-            await channels_api.channels_channel_id_answer_post(
-                context.channel.id, x_asterisk_id=context.asterisk_id)
+            await self.ari_call(
+                'answer', context.asterisk_id,
+                self.ari.channels.channels_channel_id_answer_post,
+                context.channel.id, idempotent=True)
 
             logger.info("Answered channel %s successful" % context)
         except Exception as e:
             logger.error("Error while answering channel %s : %s" % (
                 context, e))
 
-    async def _dial_asterisk(self, context, asterisk_id, extension):
-        loop = asyncio.get_event_loop()
+    async def hangup(self, context):
+        logger.info("Hanging up channel : %s" % context)
+
+        try:
+            await self.ari_call(
+                'hangup', context.asterisk_id,
+                self.ari.channels.channels_channel_id_delete,
+                context.channel.id, idempotent=True)
 
-        c = consul.aio.Consul(
-            host=self.config.consul_host,
-            port=self.config.consul_port, loop=loop)
+            logger.info("Hung up channel %s successful" % context)
+        except Exception as e:
+            logger.error("Error while hanging up channel %s : %s" % (
+                context, e))
 
-        (_, nodes) = await c.health.service("asterisk")
-        for node in nodes:
-            service = node.get("Service", {})
-            meta = service.get("Meta", {})
-            eid = meta.get("eid")
+    async def _dial_asterisk(self, asterisk_id, to_asterisk_id, extension,
+                             channel_id=None):
+        node = self.catalog.get(to_asterisk_id)
+        if node is None:
+            logger.error("Asterisk %s not found in the catalog" %
+                         to_asterisk_id)
+            return
 
-            if asterisk_id == eid:
-                return await self._dial(context, extension,
-                                        service['Address'], service['Port'])
+        return await self._dial(asterisk_id, extension, node.address,
+                                node.port, channel_id)
 
-    async def _dial(self, context, extension, adddress, port):
+    async def _dial(self, asterisk_id, extension, adddress, port,
+                    channel_id=None):
         endpoint = "SIP/%s:%s/%s" % (adddress, port, extension)
 
+        # the events of the channel come back to the worker dialing it
+        channel_id = channel_id or originated_channel_id(self.worker_index)
+
         logger.info("Dialing endpoint %s" % endpoint)
         try:
-            channels_api = swagger_client.ChannelsApi(self.api_client)
-            return await channels_api.channels_post(
-                endpoint, app=self.id,
-                x_asterisk_id=context.asterisk_id)
+            return await self.ari_call(
+                'dial', asterisk_id,
+                self.ari.channels.channels_post, endpoint, app=self.id,
+                channel_id=channel_id)
         except Exception as e:
             logger.error("Error while dialing endpoint %s : %s" %
                          (endpoint, e))
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Coalescer:
+    """Group the items submitted for a key into a single request.
+
+    Items added for the same key within `window` seconds, or the same loop
+    iteration with a window of 0, are sent together by `send(key, items)`.
+    Every caller gets the result of the request. If a grouped request
+    fails, the items are sent one by one so that each caller gets its own
+    result or error.
+    """
+
+    def __init__(self, send, window=0):
+        self.send = send
+        self.window = window
+        self.pending = dict()
+
+    async def add(self, key, item):
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+
+        batch = self.pending.get(key)
+        if batch is None:
+            batch = self.pending[key] = []
+            if self.window:
+                loop.call_later(self.window, self._flush, key)
+            else:
+                loop.call_soon(self._flush, key)
+        batch.append((item, future))
+
+        return await future
+
+    def _flush(self, key):
+        batch = self.pending.pop(key)
+        asyncio.ensure_future(self._send(key, batch))
+
+    async def _send(self, key, batch):
+        items = [item for (item, _) in batch]
+        try:
+            result = await self.send(key, items)
+        except Exception as e:
+            if len(batch) == 1:
+                self._set(batch[0][1], exc=e)
+                return
+
+            logger.warning("Grouped request of %d items failed for %s, "
+                           "sending them one by one : %s" %
+                           (len(batch), key, e))
+            await asyncio.gather(*[self._send(key, [entry])
+                                   for entry in batch])
+            return
+
+        for (_, future) in batch:
+            self._set(future, result=result)
+
+    def _set(self, future, result=None, exc=None):
+        # the caller may have given up in the meantime
+        if future.done():
+            return
+        if exc is not None:
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
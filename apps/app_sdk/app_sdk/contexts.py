@@ -0,0 +1,102 @@
+import collections
+import heapq
+import itertools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ContextStore:
+    """Live contexts of an application with their last activity.
+
+    Used as the `contextes` dict of the Application. A context not touched
+    by any event for `ttl` seconds is considered lost, e.g. missed StasisEnd
+    or crashed Asterisk, and is returned by `expire()`. Deadlines are kept
+    in a heap where an entry is only refreshed when it reaches the top, so
+    that touching a context is O(1) and a sweep is O(expired) amortized.
+    A `ttl` of 0 disables the expiration. The live contexts are counted per
+    Asterisk.
+    """
+
+    def __init__(self, ttl, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+
+        # context -> [context, deadline, alive]
+        self.entries = dict()
+        self.heap = []
+        self.counter = itertools.count()
+        self.asterisk_counts = collections.Counter()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, context):
+        return context in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __getitem__(self, context):
+        return self.entries[context][0]
+
+    def __setitem__(self, context, value):
+        entry = self.entries.get(context)
+        if entry:
+            entry[0] = value
+            self.touch(context)
+            return
+
+        deadline = self.clock() + self.ttl
+        entry = [value, deadline, True]
+        self.entries[context] = entry
+        self.asterisk_counts[context.asterisk_id] += 1
+        if self.ttl:
+            heapq.heappush(self.heap, (deadline, next(self.counter), entry))
+
+    def get(self, context, default=None):
+        entry = self.entries.get(context)
+        if entry is None:
+            return default
+        return entry[0]
+
+    def pop(self, context, default=None):
+        entry = self.entries.pop(context, None)
+        if entry is None:
+            return default
+
+        # the heap entry is dropped lazily when it reaches the top
+        entry[2] = False
+        self.asterisk_counts[context.asterisk_id] -= 1
+        return entry[0]
+
+    def count(self, asterisk_id):
+        return self.asterisk_counts[asterisk_id]
+
+    def touch(self, context):
+        entry = self.entries.get(context)
+        if entry:
+            entry[1] = self.clock() + self.ttl
+
+    def expire(self):
+        now = self.clock()
+        expired = []
+        while self.heap and self.heap[0][0] <= now:
+            (deadline, _, entry) = heapq.heappop(self.heap)
+            if not entry[2]:
+                continue
+
+            if entry[1] > now:
+                # touched since it got pushed
+                heapq.heappush(self.heap,
+                               (entry[1], next(self.counter), entry))
+                continue
+
+            entry[2] = False
+            context = entry[0]
+            self.entries.pop(context, None)
+            self.asterisk_counts[context.asterisk_id] -= 1
+            expired.append(context)
+
+        return expired
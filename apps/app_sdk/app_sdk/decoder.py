@@ -0,0 +1,55 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+DECODERS = {'json': json.loads}
+
+try:
+    import orjson
+    DECODERS['orjson'] = orjson.loads
+except ImportError:
+    pass
+
+try:
+    import ujson
+    DECODERS['ujson'] = ujson.loads
+except ImportError:
+    pass
+
+# preference order of the `auto` decoder
+PREFERRED = ('orjson', 'ujson', 'json')
+
+
+def get_decoder(name='auto'):
+    """Return the function used to decode the Stasis events.
+
+    `auto` picks the fastest installed decoder, stdlib `json` otherwise.
+    """
+    if name == 'auto':
+        name = next(n for n in PREFERRED if n in DECODERS)
+
+    decoder = DECODERS.get(name)
+    if decoder is None:
+        raise ValueError("JSON decoder %s is not available" % name)
+
+    logger.info("Using %s JSON decoder" % name)
+    return decoder
+
+
+def app_filter(app_name):
+    """Return a predicate telling if a raw event may concern `app_name`.
+
+    The application name has to appear as a JSON string somewhere in the
+    body, a cheap byte search that rejects most of the events of other
+    applications before paying a full parse. It never rejects an event of
+    the application, the full check is still done after decoding.
+    """
+    needle = ('"%s"' % app_name).encode()
+
+    def accept(body):
+        if isinstance(body, str):
+            body = body.encode()
+        return needle in body
+
+    return accept
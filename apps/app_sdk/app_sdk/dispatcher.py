@@ -0,0 +1,58 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Dispatcher:
+    """Run the event callbacks on a fixed number of worker coroutines.
+
+    Callbacks are sharded by key, the context, (asterisk_id, channel id), for
+    channel events, so that the events of a channel are handled in order
+    while a slow handler only holds up the channels that share its shard.
+    """
+
+    def __init__(self, workers, queue_size=0, durations=None):
+        self.workers = max(workers, 1)
+        self.queue_size = queue_size
+        self.durations = durations
+        self.shards = []
+        self.tasks = []
+
+    def start(self):
+        self.shards = [asyncio.Queue(self.queue_size)
+                       for _ in range(self.workers)]
+        self.tasks = [asyncio.ensure_future(self.worker(shard))
+                      for shard in self.shards]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def dispatch(self, key, callback, *args):
+        # waits if the shard is full, the event queue then fills up and
+        # triggers the backpressure
+        shard = self.shards[hash(key) % self.workers]
+        await shard.put((callback, args))
+
+    def depths(self):
+        return [shard.qsize() for shard in self.shards]
+
+    async def worker(self, shard):
+        while True:
+            (callback, args) = await shard.get()
+            start = time.monotonic()
+            try:
+                await callback(*args)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error while handling event with %s : %s" %
+                             (callback.__name__, e))
+
+            if self.durations:
+                self.durations.labels(callback.__name__).observe(
+                    time.monotonic() - start)
@@ -0,0 +1,66 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def event_handler(type, state=None):
+    """Register the decorated coroutine method as handler of Stasis events.
+
+    The handler is called with the context of the channel, or None for the
+    events without channel (e.g. BridgeDestroyed), and the decoded event.
+    `state` restricts the handler to the events of a channel in that state.
+    Can be stacked to handle several event types.
+
+        @event_handler('ChannelDtmfReceived')
+        async def on_dtmf(self, context, event):
+            ...
+    """
+    def decorator(func):
+        func.__dict__.setdefault('_event_handlers', []).append((type, state))
+        return func
+    return decorator
+
+
+class EventRegistry:
+    """Dispatch table of the handlers of an application.
+
+    Built once from the decorated methods of the application class and its
+    mixins, maps an event type to its handlers by channel state, `None`
+    holding the handlers for any state.
+    """
+
+    def __init__(self, obj):
+        self.table = dict()
+
+        handlers = []
+        for cls in reversed(type(obj).__mro__):
+            for (name, attr) in vars(cls).items():
+                for (type_, state) in getattr(attr, '_event_handlers', []):
+                    if (name, type_, state) not in handlers:
+                        handlers.append((name, type_, state))
+
+        by_type = dict()
+        for (name, type_, state) in handlers:
+            # bind by name so that overridden methods are the ones called
+            callback = getattr(obj, name)
+            by_type.setdefault(type_, dict()).setdefault(
+                state, []).append(callback)
+
+        for (type_, by_state) in by_type.items():
+            any_state = tuple(by_state.pop(None, []))
+            table = {state: tuple(callbacks) + any_state
+                     for (state, callbacks) in by_state.items()}
+            table[None] = any_state
+            self.table[type_] = table
+
+    def __contains__(self, type):
+        return type in self.table
+
+    def types(self):
+        return list(self.table)
+
+    def handlers(self, type, state=None):
+        table = self.table.get(type)
+        if table is None:
+            return ()
+        return table.get(state, table[None])
@@ -1,6 +1,4 @@
 import logging
-import swagger_client
-from swagger_client.rest import ApiException
 
 logger = logging.getLogger(__name__)
 
@@ -14,11 +12,12 @@ class MediaMixin:
             return
 
         try:
-            channels_api = swagger_client.ChannelsApi(self.api_client)
-            await channels_api.channels_channel_id_play_post(
-                context.channel.id, [uri], x_asterisk_id=context.asterisk_id)
+            await self.ari_call(
+                'play', context.asterisk_id,
+                self.ari.channels.channels_channel_id_play_post,
+                context.channel.id, [uri])
 
             logger.info("Play something on channel %s" % context)
-        except ApiException as e:
+        except Exception as e:
             logger.error("Error while playing something %s : %s" %
                          (context, e))
\ No newline at end of file
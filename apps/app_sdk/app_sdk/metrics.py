@@ -0,0 +1,174 @@
+import bisect
+import logging
+
+logger = logging.getLogger(__name__)
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+# seconds, from a local ARI call to a stuck handler
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return (str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'))
+
+
+def _labels(names, values, extra=None):
+    pairs = ['%s="%s"' % (n, _escape(v)) for (n, v) in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(pairs)
+
+
+class CounterValue:
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class GaugeValue(CounterValue):
+
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+class HistogramValue:
+
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Metric:
+    """Metric with one value per label values tuple.
+
+    `labels()` is a dict lookup on the tuple of values, label strings are
+    only built when rendering.
+    """
+
+    value_class = {COUNTER: CounterValue, GAUGE: GaugeValue}
+
+    def __init__(self, name, help, type, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = dict()
+
+    def labels(self, *values):
+        value = self.values.get(values)
+        if value is None:
+            if self.type == HISTOGRAM:
+                value = HistogramValue(self.buckets)
+            else:
+                value = self.value_class[self.type]()
+            self.values[values] = value
+        return value
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def samples(self):
+        for (values, value) in self.values.items():
+            if self.type != HISTOGRAM:
+                yield (self.name, _labels(self.label_names, values),
+                       value.value)
+                continue
+
+            total = 0
+            for (le, count) in zip(self.buckets + ('+Inf',), value.counts):
+                total += count
+                yield ("%s_bucket" % self.name,
+                       _labels(self.label_names, values, 'le="%s"' % le),
+                       total)
+            yield ("%s_sum" % self.name, _labels(self.label_names, values),
+                   value.sum)
+            yield ("%s_count" % self.name, _labels(self.label_names, values),
+                   total)
+
+
+class CallbackMetric(Metric):
+    """Metric read from `func` at render time, e.g. the size of a dict.
+
+    With labels, `func` returns a list of (label values, value).
+    """
+
+    def __init__(self, name, help, type, func, labels=()):
+        super(CallbackMetric, self).__init__(name, help, type, labels)
+        self.func = func
+
+    def samples(self):
+        if self.label_names:
+            values = self.func()
+        else:
+            values = [((), self.func())]
+
+        for (labels, value) in values:
+            yield (self.name, _labels(self.label_names, labels), value)
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Metric(name, help, COUNTER, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Metric(name, help, GAUGE, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Metric(name, help, HISTOGRAM, labels, buckets))
+
+    def callback(self, name, help, func, type=GAUGE, labels=()):
+        return self.register(CallbackMetric(name, help, type, func, labels))
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append("# HELP %s %s" % (metric.name, metric.help))
+            lines.append("# TYPE %s %s" % (metric.name, metric.type))
+            try:
+                for (name, labels, value) in metric.samples():
+                    lines.append("%s%s %s" % (name, labels, value))
+            except Exception as e:
+                logger.error("Error while collecting %s : %s" %
+                             (metric.name, e))
+        lines.append('')
+        return '\n'.join(lines)
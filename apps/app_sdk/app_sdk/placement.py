@@ -0,0 +1,78 @@
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+FIRST_CALLER_PLACEMENT = 'first_caller'
+LEAST_LOADED_PLACEMENT = 'least_loaded'
+RENDEZVOUS_PLACEMENT = 'rendezvous'
+
+# load figures of LeastLoadedPlacement
+CHANNELS_LOAD = 'channels'
+META_LOAD = 'meta'
+
+
+class FirstCallerPlacement:
+    """The Asterisk of the first caller hosts the master bridge."""
+
+    def choose(self, bridge_id, asterisk_id, nodes):
+        return asterisk_id
+
+
+class LeastLoadedPlacement:
+    """The least loaded Asterisk hosts the master bridge.
+
+    `load` returns the load figure of an Asterisk node of the catalog. On a
+    tie the Asterisk of the caller wins, saving its trunk, then the lowest
+    eid so that all the instances agree.
+    """
+
+    def __init__(self, load):
+        self.load = load
+
+    def choose(self, bridge_id, asterisk_id, nodes):
+        if not nodes:
+            return asterisk_id
+
+        def key(node):
+            return (self.load(node), node.eid != asterisk_id, node.eid)
+
+        return min(nodes, key=key).eid
+
+
+class RendezvousPlacement:
+    """The Asterisk with the highest hash of (bridge, eid) hosts the master
+    bridge.
+
+    Spreads many small bridges evenly without any load figure, every
+    instance computes the same master, and an Asterisk joining or leaving
+    only moves the bridges that it wins or hosted.
+    """
+
+    def score(self, bridge_id, eid):
+        digest = hashlib.md5(("%s:%s" % (bridge_id, eid)).encode()).digest()
+        return int.from_bytes(digest[:8], 'big')
+
+    def choose(self, bridge_id, asterisk_id, nodes):
+        if not nodes:
+            return asterisk_id
+
+        return max(nodes, key=lambda node: self.score(bridge_id, node.eid)).eid
+
+
+def meta_load(node):
+    """Load published by the Asterisk in the `load` meta of its service."""
+    try:
+        return float(node.meta.get('load', 0))
+    except ValueError:
+        return 0.0
+
+
+def create_placement(config, contexts):
+    if config.bridge_placement == LEAST_LOADED_PLACEMENT:
+        if config.bridge_placement_load == META_LOAD:
+            return LeastLoadedPlacement(meta_load)
+        return LeastLoadedPlacement(lambda node: contexts.count(node.eid))
+    if config.bridge_placement == RENDEZVOUS_PLACEMENT:
+        return RendezvousPlacement()
+    return FirstCallerPlacement()
@@ -0,0 +1,148 @@
+import aiohttp
+import asyncio
+import logging
+import time
+from swagger_client.rest import ApiException
+
+from app_sdk.backoff import Backoff
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpenError(Exception):
+
+    def __init__(self, asterisk_id):
+        super(CircuitOpenError, self).__init__(
+            "circuit open for Asterisk %s" % asterisk_id)
+        self.asterisk_id = asterisk_id
+
+
+class CircuitBreaker:
+    """Fail fast for an Asterisk that keeps failing.
+
+    Opens after `threshold` consecutive failures, then lets one probe call
+    through every `reset_timeout` seconds, closing again on its success.
+    A probe ending without an answer, e.g. cancelled, reopens the circuit
+    so that the next call probes again.
+    """
+
+    def __init__(self, threshold, reset_timeout, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+
+    def allow(self):
+        if self.state == CLOSED:
+            return True
+
+        if (self.state == OPEN and
+                self.clock() - self.opened_at >= self.reset_timeout):
+            self.state = HALF_OPEN
+            return True
+
+        return False
+
+    def success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.threshold:
+            if self.state != OPEN:
+                logger.warning("Opening circuit after %d failures" %
+                               self.failures)
+            self.state = OPEN
+            self.opened_at = self.clock()
+
+    def abort(self):
+        if self.state == HALF_OPEN:
+            self.state = OPEN
+
+    def as_dict(self):
+        return {'state': self.state, 'failures': self.failures}
+
+
+class CallPolicy:
+    """Deadline, retries and circuit breaker of the ARI calls.
+
+    Calls are keyed by `x_asterisk_id` for the breaker and by operation for
+    the timeout, `api.timeouts` overriding `api.timeout` per operation.
+    Only idempotent operations are retried. An ARI error answer (4xx) means
+    that the Asterisk is alive and is not counted as a failure.
+    """
+
+    def __init__(self, config, durations=None):
+        self.durations = durations
+        self.timeout = config.api_timeout
+        self.timeouts = dict(config.api_timeouts)
+        self.retries = config.api_retries
+        self.threshold = config.api_breaker_threshold
+        self.reset_timeout = config.api_breaker_reset
+
+        self.breakers = dict()
+
+    def breaker(self, asterisk_id):
+        breaker = self.breakers.get(asterisk_id)
+        if breaker is None:
+            breaker = self.breakers[asterisk_id] = CircuitBreaker(
+                self.threshold, self.reset_timeout)
+        return breaker
+
+    async def call(self, operation, asterisk_id, func, *args,
+                   idempotent=False, **kwargs):
+        breaker = self.breaker(asterisk_id)
+        timeout = self.timeouts.get(operation, self.timeout)
+        attempts = 1 + (self.retries if idempotent else 0)
+        backoff = Backoff(0.05, 1)
+
+        for attempt in range(attempts):
+            if not breaker.allow():
+                raise CircuitOpenError(asterisk_id)
+
+            start = time.monotonic()
+            try:
+                result = await asyncio.wait_for(
+                    func(*args, x_asterisk_id=asterisk_id, **kwargs),
+                    timeout)
+            except ApiException as e:
+                if e.status and 400 <= e.status < 500:
+                    breaker.success()
+                    raise
+                breaker.failure()
+                error = e
+            except (asyncio.TimeoutError, aiohttp.ClientError, OSError) as e:
+                breaker.failure()
+                error = e
+            except BaseException:
+                # cancelled or unexpected error, not the fault of the
+                # Asterisk but a probe has to report back
+                breaker.abort()
+                raise
+            else:
+                breaker.success()
+                return result
+            finally:
+                if self.durations:
+                    self.durations.labels(operation, asterisk_id).observe(
+                        time.monotonic() - start)
+
+            if attempt + 1 < attempts:
+                logger.warning("%s on %s failed, retrying : %r" %
+                               (operation, asterisk_id, error))
+                await asyncio.sleep(backoff.next())
+
+        raise error
+
+    def status(self):
+        return {asterisk_id: breaker.as_dict()
+                for (asterisk_id, breaker) in self.breakers.items()}
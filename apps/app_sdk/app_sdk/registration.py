@@ -0,0 +1,143 @@
+import asyncio
+import consul
+import consul.aio
+import json
+import logging
+
+from app_sdk.backoff import Backoff
+
+logger = logging.getLogger(__name__)
+
+
+class ConsulRegistration:
+    """Service registration of the application kept alive by a TTL check.
+
+    The service is registered once with a TTL check that the application
+    passes every third of the TTL, with its load as notes, instead of Consul
+    polling an HTTP check. A heartbeat refused by the agent means that it
+    lost the service, restarted or deregistered, which is then registered
+    again.
+    """
+
+    def __init__(self, config, name, service_id, load=None):
+        self.config = config
+        self.name = name
+        self.service_id = service_id
+        self.check_id = "service:%s" % service_id
+        self.ttl = config.consul_ttl
+        self.load = load
+
+        self.app_registered = False
+
+    async def register(self, c):
+        logger.info("Registering application %s in Consul" % self.name)
+        if not self.app_registered:
+            response = await c.kv.put("applications/%s" % self.name, "1")
+            if response is not True:
+                raise Exception("error",
+                                "registering application %s" % self.name)
+            self.app_registered = True
+
+        response = await c.agent.service.register(
+            self.name, service_id=self.service_id,
+            address=self.config.host, port=self.config.port,
+            check=consul.Check.ttl("%ds" % self.ttl))
+        if response is not True:
+            raise Exception("error", "registering service %s" % self.name)
+
+        logger.info("Service %s registered in Consul" % self.name)
+
+    async def heartbeat(self, c):
+        notes = json.dumps(self.load()) if self.load else None
+        return await c.agent.check.ttl_pass(self.check_id, notes=notes)
+
+    async def deregister(self, c):
+        try:
+            await c.agent.service.deregister(self.service_id)
+            logger.info("Service %s deregistered from Consul" % self.name)
+        except Exception as e:
+            logger.error("Consul error: %s", e)
+
+    async def run(self, loop):
+        c = consul.aio.Consul(
+            host=self.config.consul_host,
+            port=self.config.consul_port, loop=loop)
+
+        registered = False
+        backoff = Backoff()
+        try:
+            while True:
+                try:
+                    if not registered:
+                        await self.register(c)
+                        registered = True
+
+                    registered = await self.heartbeat(c) is True
+                    if registered:
+                        backoff.reset()
+                        delay = self.ttl / 3
+                    else:
+                        logger.warning(
+                            "Service %s lost by the Consul agent" %
+                            self.name)
+                        delay = backoff.next()
+                except Exception as e:
+                    logger.error("Consul error: %s", e)
+                    registered = False
+                    delay = backoff.next()
+
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            if registered:
+                await self.deregister(c)
+
+
+class AriRegistrations:
+    """Registration of the application on every Asterisk of the catalog.
+
+    One task per Asterisk retries the registration with backoff until the
+    Asterisk accepts it, and is not run again until the Asterisk service
+    is registered again in Consul (new ModifyIndex, e.g. after a restart).
+    The tasks of the Asterisk leaving the catalog are cancelled.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.tasks = dict()
+
+    def update(self, nodes):
+        for (eid, (index, task)) in list(self.tasks.items()):
+            node = nodes.get(eid)
+            if node is None or node.index != index:
+                task.cancel()
+                del self.tasks[eid]
+
+        for (eid, node) in nodes.items():
+            if eid not in self.tasks:
+                task = asyncio.ensure_future(self.supervise(eid))
+                self.tasks[eid] = (node.index, task)
+
+    async def supervise(self, eid):
+        backoff = Backoff()
+        while True:
+            try:
+                await self.app.register_ari(eid)
+                return
+            except asyncio.CancelledError:
+                return
+            except Exception as e:
+                logger.error("Error while registering application %s on "
+                             "%s : %s" % (self.app.name, eid, e))
+
+            await asyncio.sleep(backoff.next())
+
+    async def run(self, loop):
+        catalog = self.app.catalog
+
+        catalog.add_listener(self.update)
+        try:
+            self.update(catalog.nodes)
+            await loop.create_future()
+        except asyncio.CancelledError:
+            catalog.remove_listener(self.update)
+            self.update({})
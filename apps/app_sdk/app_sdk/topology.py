@@ -0,0 +1,40 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TreeTopology:
+    """Tree of trunks between the Asterisk of a bridge, rooted at its master.
+
+    The Asterisk are placed in a `fanout`-ary tree in their joining order,
+    each one trunking to its parent, so that no Asterisk mixes more than
+    `fanout` trunks besides its own participants. A fan-out of 0 is the
+    star where every Asterisk trunks to the master.
+    """
+
+    def __init__(self, fanout=0):
+        self.fanout = fanout
+
+    def order(self, root, members):
+        return [root] + [m for m in members if m != root]
+
+    def parent(self, root, members, asterisk_id):
+        if asterisk_id == root:
+            return None
+        if not self.fanout:
+            return root
+
+        order = self.order(root, members)
+        return order[(order.index(asterisk_id) - 1) // self.fanout]
+
+    def plan(self, root, members):
+        """Parent of every Asterisk of the bridge but the root."""
+        if root is None:
+            return dict()
+
+        order = self.order(root, members)
+        if not self.fanout:
+            return {asterisk_id: root for asterisk_id in order[1:]}
+
+        return {asterisk_id: order[(i - 1) // self.fanout]
+                for (i, asterisk_id) in enumerate(order) if i}
@@ -0,0 +1,102 @@
+import aiohttp
+import asyncio
+import logging
+import urllib.parse
+
+from app_sdk.backoff import Backoff
+
+logger = logging.getLogger(__name__)
+
+
+class WebSocketMessage:
+    """Event received on an ARI WebSocket, there is nothing to acknowledge."""
+
+    __slots__ = ('body',)
+
+    sender = None
+
+    def __init__(self, body):
+        self.body = body
+
+    def ack(self):
+        pass
+
+
+class WebSocketTransport:
+    """ARI event WebSockets opened directly to each Asterisk of Consul.
+
+    Alternative to the res_stasis_amqp -> RabbitMQ path: the events are fed
+    to the same event queue and processing. Connecting the WebSocket
+    registers the Stasis application on the Asterisk, replacing an AMQP
+    registration of the same application.
+
+    Asterisk keeps one WebSocket per application, a second instance of the
+    application connecting takes over the events of the first one, so this
+    transport is for a single instance. Only the parent process of the
+    workers connects.
+    """
+
+    def __init__(self, app, queue):
+        self.app = app
+        self.queue = queue
+        self.connections = dict()
+
+    async def run(self, loop):
+        catalog = self.app.catalog
+        session = aiohttp.ClientSession()
+
+        def on_change(nodes):
+            self.update(session, {eid: node.address
+                                  for (eid, node) in nodes.items()})
+
+        catalog.add_listener(on_change)
+        try:
+            on_change(catalog.nodes)
+            await loop.create_future()
+        except asyncio.CancelledError:
+            catalog.remove_listener(on_change)
+            self.update(session, {})
+            await session.close()
+
+    def update(self, session, addresses):
+        for (eid, (address, task)) in list(self.connections.items()):
+            if addresses.get(eid) != address:
+                task.cancel()
+                del self.connections[eid]
+
+        for (eid, address) in addresses.items():
+            if eid not in self.connections:
+                task = asyncio.ensure_future(
+                    self.connect(session, eid, address))
+                self.connections[eid] = (address, task)
+
+    async def connect(self, session, eid, address):
+        config = self.app.config
+        url = "ws://%s:%d/ari/events?%s" % (
+            address, config.api_asterisk_port, urllib.parse.urlencode({
+                'app': self.app.name,
+                'api_key': "%s:%s" % (config.api_username,
+                                      config.api_password)}))
+
+        backoff = Backoff()
+        while True:
+            try:
+                async with session.ws_connect(url, heartbeat=30) as ws:
+                    logger.info("Receiving events of %s on WebSocket" % eid)
+                    backoff.reset()
+
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            await self.queue.put(
+                                WebSocketMessage(msg.data.encode()))
+                        elif msg.type == aiohttp.WSMsgType.ERROR:
+                            break
+            except asyncio.CancelledError:
+                return
+            except (aiohttp.ClientError, OSError) as e:
+                logger.error("WebSocket error on %s : %s" % (eid, e))
+
+            delay = backoff.next()
+            logger.info("Reconnecting WebSocket of %s in %.1f seconds" %
+                        (eid, delay))
+            await asyncio.sleep(delay)
@@ -0,0 +1,177 @@
+import asyncio
+import bisect
+import logging
+import multiprocessing
+import socket
+import struct
+import uuid
+import zlib
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct('!I')
+
+# prefix of the ids of the channels originated by a worker
+WORKER_CHANNEL_PREFIX = 'worker'
+
+
+def originated_channel_id(worker_index):
+    """Id of a channel originated by the worker, its events are routed back
+    to that worker."""
+    if worker_index is None:
+        return str(uuid.uuid4())
+    return "%s%d-%s" % (WORKER_CHANNEL_PREFIX, worker_index, uuid.uuid4())
+
+
+def originating_worker(channel_id):
+    """Index of the worker that originated the channel, None if unknown."""
+    if not channel_id.startswith(WORKER_CHANNEL_PREFIX):
+        return None
+    try:
+        return int(channel_id[len(WORKER_CHANNEL_PREFIX):].split('-', 1)[0])
+    except ValueError:
+        return None
+
+
+class HashRing:
+    """Consistent hashing of keys, e.g. channel ids, onto nodes."""
+
+    def __init__(self, nodes, replicas=64):
+        self.ring = sorted(
+            (zlib.crc32(("%s-%d" % (node, i)).encode()), node)
+            for node in nodes for i in range(replicas))
+        self.hashes = [h for (h, _) in self.ring]
+
+    def get(self, key):
+        h = zlib.crc32(key.encode())
+        index = bisect.bisect(self.hashes, h) % len(self.ring)
+        return self.ring[index][1]
+
+
+class ForwardedMessage:
+    """Event forwarded by the parent process, already acknowledged there."""
+
+    __slots__ = ('body',)
+
+    sender = None
+
+    def __init__(self, body):
+        self.body = body
+
+    def ack(self):
+        pass
+
+
+class WorkerPool:
+    """Worker processes of an application sharing one AMQP consumption.
+
+    The parent process consumes the AMQP queue and forwards each event to
+    the worker owning its channel on a hash ring, so that all the events of
+    a channel, and its context, stay in the same process. The channels
+    originated by a worker, e.g. trunks, go back to it. Bridge events go to
+    all the workers, each one caching the bridges. Events are sent as
+    length-prefixed frames over a socket pair, a worker not keeping up
+    stops reading which pushes back up to the AMQP consumption of the
+    parent. Every worker serves the HTTP API on the same listening socket.
+
+    A worker that dies is started again, the events already forwarded to it
+    are lost as the parent acknowledged them.
+    """
+
+    def __init__(self, app, count):
+        self.app = app
+        self.count = count
+
+        self.ring = HashRing(range(count))
+        self.sock = None
+        self.processes = [None] * count
+        self.pairs = [None] * count
+        self.writers = [None] * count
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("0.0.0.0", self.app.config.port))
+        self.sock.listen(socket.SOMAXCONN)
+
+        for index in range(self.count):
+            self.spawn(index)
+
+    def spawn(self, index):
+        ctx = multiprocessing.get_context('fork')
+
+        (parent_end, worker_end) = socket.socketpair()
+        process = ctx.Process(target=self.app.run_worker,
+                              args=(index, worker_end, self.sock),
+                              name="%s-worker-%d" % (self.app.id, index))
+        process.start()
+        worker_end.close()
+
+        self.processes[index] = process
+        self.pairs[index] = parent_end
+
+        logger.info("Started worker %d, pid %d" % (index, process.pid))
+
+    async def connect(self):
+        for index in range(self.count):
+            await self.connect_worker(index)
+
+    async def connect_worker(self, index):
+        (_, writer) = await asyncio.open_connection(sock=self.pairs[index])
+        self.writers[index] = writer
+
+    async def supervise(self, interval=1):
+        try:
+            while True:
+                await asyncio.sleep(interval)
+
+                for (index, process) in enumerate(self.processes):
+                    if process.is_alive():
+                        continue
+
+                    logger.error("Worker %d died with exit code %s, "
+                                 "restarting it" % (index, process.exitcode))
+                    process.join()
+                    self.writers[index].close()
+
+                    self.spawn(index)
+                    await self.connect_worker(index)
+        except asyncio.CancelledError:
+            pass
+
+    async def forward(self, key, body):
+        await self.send(self.ring.get(key), body)
+
+    async def broadcast(self, body):
+        for index in range(self.count):
+            await self.send(index, body)
+
+    async def send(self, index, body):
+        writer = self.writers[index]
+        writer.write(FRAME_HEADER.pack(len(body)))
+        writer.write(body)
+        await writer.drain()
+
+    def stop(self):
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join()
+        self.sock.close()
+
+
+async def read_forwarded(sock, queue):
+    """Worker side of WorkerPool.forward, feeds the worker event queue."""
+    (reader, _) = await asyncio.open_connection(sock=sock)
+    try:
+        while True:
+            (size,) = FRAME_HEADER.unpack(
+                await reader.readexactly(FRAME_HEADER.size))
+            body = await reader.readexactly(size)
+
+            await queue.put(ForwardedMessage(body))
+    except asyncio.IncompleteReadError:
+        logger.error("Parent process went away")
+    except asyncio.CancelledError:
+        pass
@@ -0,0 +1,94 @@
+"""Memory and lookup throughput of the contexts table at 100k channels.
+
+Compares the slotted Channel/Context of the SDK with the previous
+dict-backed implementation, kept here for reference.
+
+    python benchmarks/bench_contexts.py --contexts 100000
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from app_sdk import Context
+from app_sdk.channel import Channel
+
+
+class LegacyChannel:
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    @property
+    def id(self):
+        return self.obj.get('id')
+
+
+class LegacyContext:
+
+    def __init__(self, asterisk_id, channel):
+        self.asterisk_id = asterisk_id
+        self.channel = channel
+        self._user_data = None
+
+    def __hash__(self):
+        return hash((self.asterisk_id, self.channel.id))
+
+    def __eq__(self, other):
+        return ((self.asterisk_id, self.channel.id) ==
+                (other.asterisk_id, other.channel.id))
+
+
+def channel_obj(i):
+    # what json.loads returns for the channel of a StasisStart
+    return {
+        'id': '1578997263.%d' % i,
+        'name': 'PJSIP/demo-%08x' % i,
+        'state': 'Up',
+        'caller': {'name': 'demo', 'number': 'demo'},
+        'connected': {'name': '', 'number': ''},
+        'accountcode': '',
+        'dialplan': {'context': 'default', 'exten': '7001', 'priority': 2,
+                     'app_name': 'Stasis', 'app_data': 'conf'},
+        'creationtime': '2020-01-14T10:21:03.412+0000',
+        'language': 'en'}
+
+
+def bench(name, channel_cls, context_cls, count, lookups):
+    asterisks = ['02:42:ac:1c:00:%02x' % i for i in range(20)]
+
+    gc.collect()
+    tracemalloc.start()
+    contextes = dict()
+    for i in range(count):
+        context = context_cls(asterisks[i % 20], channel_cls(channel_obj(i)))
+        contextes[context] = context
+    (memory, _) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # lookups as done for every event: a fresh context probing the table
+    probes = [context_cls(asterisks[i % 20], channel_cls(channel_obj(i)))
+              for i in range(0, count, max(count // lookups, 1))]
+    start = time.perf_counter()
+    for _ in range(max(lookups // len(probes), 1)):
+        for probe in probes:
+            contextes.get(probe, probe)
+    elapsed = time.perf_counter() - start
+    done = max(lookups // len(probes), 1) * len(probes)
+
+    print("%-8s %8.1f MB  %6d bytes/context  %6.0f ns/lookup" % (
+        name, memory / 1e6, memory / count, elapsed * 1e9 / done))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--contexts", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=1000000)
+    args = parser.parse_args()
+
+    bench("legacy", LegacyChannel, LegacyContext, args.contexts, args.lookups)
+    bench("slots", Channel, Context, args.contexts, args.lookups)
+
+
+if __name__ == "__main__":
+    main()
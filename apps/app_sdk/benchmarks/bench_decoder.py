@@ -0,0 +1,54 @@
+"""Parse cost per Stasis event for each available decoder.
+
+Replays the Stasis payloads of `payloads/stasis.jsonl`, captured in the
+compact form published by res_stasis_amqp, through every installed JSON
+decoder, with and without the application pre-filter, as seen by the
+`conf` application.
+
+    python benchmarks/bench_decoder.py
+"""
+import argparse
+import os
+import time
+
+from app_sdk.decoder import DECODERS, app_filter
+
+PAYLOADS = os.path.join(os.path.dirname(__file__), 'payloads', 'stasis.jsonl')
+
+
+def bench(payloads, decode, prefilter, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for body in payloads:
+            if prefilter and not prefilter(body):
+                continue
+            decode(body)
+    elapsed = time.perf_counter() - start
+
+    return elapsed * 1e9 / (rounds * len(payloads))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app", default="conf")
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--payloads", default=PAYLOADS)
+    args = parser.parse_args()
+
+    with open(args.payloads, 'rb') as f:
+        payloads = [line.strip() for line in f if line.strip()]
+
+    prefilter = app_filter(args.app)
+    accepted = sum(1 for body in payloads if prefilter(body))
+    print("%d payloads, %d for application %s" %
+          (len(payloads), accepted, args.app))
+
+    for (name, decode) in sorted(DECODERS.items()):
+        full = bench(payloads, decode, None, args.rounds)
+        filtered = bench(payloads, decode, prefilter, args.rounds)
+        print("%-8s full parse %7.0f ns/event   pre-filtered %7.0f ns/event" %
+              (name, full, filtered))
+
+
+if __name__ == "__main__":
+    main()
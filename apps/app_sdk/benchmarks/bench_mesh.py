@@ -0,0 +1,124 @@
+"""Inter-Asterisk legs and ARI calls of a conference, per participant vs
+per Asterisk trunk, star vs tree.
+
+Joins N participants spread over M Asterisk to one bridge through the
+BridgeMixin mesh logic, against a simulated ARI answering after a fixed
+latency, and counts the legs dialed to the master Asterisk and the ARI
+calls made. The previous mesh, dialing one leg per remote participant and
+looking the bridge up for every participant, is kept here for reference.
+`max_inbound` is the most legs ending on one Asterisk, bounded by the
+fan-out of the tree.
+
+    python benchmarks/bench_mesh.py --participants 200 --asterisks 4
+    python benchmarks/bench_mesh.py --asterisks 20 --fanout 4
+"""
+import argparse
+import asyncio
+import collections
+import random
+import types
+
+from app_sdk import Application, Config, Context
+from app_sdk.channel import Channel
+from swagger_client.rest import ApiException
+
+BRIDGE_ID = "conf"
+
+
+class SimulatedApplication(Application):
+
+    def __init__(self, asterisks, latency, fanout=0):
+        config = Config()
+        config.mesh_fanout = fanout
+        super(SimulatedApplication, self).__init__(config, "bench", "bench")
+
+        self.latency = latency
+        self.calls = collections.Counter()
+        self.inbound = collections.Counter()
+        self.created = set()
+        self.ari = types.SimpleNamespace(
+            bridges=types.SimpleNamespace(
+                bridges_bridge_id_get='bridge_get',
+                bridges_bridge_id_post='bridge_create'),
+            channels=types.SimpleNamespace(channels_post='dial'))
+
+        self.catalog.update([
+            {'Service': {'Address': '10.0.0.%d' % i, 'Port': 5060,
+                         'Meta': {'eid': eid}}}
+            for (i, eid) in enumerate(asterisks)])
+
+    async def ari_call(self, operation, asterisk_id, func, *args, **kwargs):
+        self.calls[operation] += 1
+        await asyncio.sleep(self.latency)
+
+        if operation == 'bridge_get':
+            if (asterisk_id, args[0]) not in self.created:
+                raise ApiException(status=404)
+            return types.SimpleNamespace(id=args[0])
+        elif operation == 'bridge_create':
+            self.created.add((asterisk_id, args[0]))
+            return types.SimpleNamespace(id=args[0])
+        elif operation == 'dial':
+            self.inbound[args[0]] += 1
+            return types.SimpleNamespace(
+                id="trunk-%d" % self.calls[operation])
+
+
+class LegacySimulatedApplication(SimulatedApplication):
+
+    async def get_or_create_bridge(self, context, id, type, extension=None):
+        # no bridge cache, one lookup per participant
+        bridge = await self._get_or_create_bridge(context.asterisk_id, id,
+                                                  type)
+        await self._mesh(context, id, extension)
+        return bridge
+
+    async def _mesh(self, context, id, extension=None):
+        master = await self.bridge_registry.elect(id, context.asterisk_id)
+        if context.asterisk_id == master:
+            return
+
+        await self._dial_asterisk(context.asterisk_id, master,
+                                  context.channel.exten)
+
+
+async def join(app, participants, asterisks, jitter):
+    async def participant(i):
+        await asyncio.sleep(random.random() * jitter)
+        context = Context(
+            asterisks[i % len(asterisks)],
+            Channel({'id': "channel-%d" % i, 'dialplan': {'exten': '7000'}}))
+        await app.get_or_create_bridge(context, BRIDGE_ID, "mixing")
+
+    await asyncio.gather(*[participant(i) for i in range(participants)])
+
+
+def run(name, cls, args):
+    asterisks = ["asterisk-%d" % i for i in range(args.asterisks)]
+    app = cls(asterisks, args.latency, args.fanout)
+
+    random.seed(args.seed)
+    asyncio.get_event_loop().run_until_complete(
+        join(app, args.participants, asterisks, args.jitter))
+
+    print("%-8s legs=%-5d max_inbound=%-5d ari_calls=%-5d %s" % (
+        name, app.calls['dial'], max(app.inbound.values() or [0]),
+        sum(app.calls.values()),
+        ' '.join('%s=%d' % item for item in sorted(app.calls.items()))))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--participants", type=int, default=200)
+    parser.add_argument("--asterisks", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.002,
+                        help="seconds per simulated ARI call")
+    parser.add_argument("--jitter", type=float, default=0.5,
+                        help="seconds over which the participants join")
+    parser.add_argument("--fanout", type=int, default=0,
+                        help="trunks per Asterisk of the tree, 0 for a star")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    run("legacy", LegacySimulatedApplication, args)
+    run("trunk", SimulatedApplication, args)
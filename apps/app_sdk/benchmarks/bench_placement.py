@@ -0,0 +1,87 @@
+"""Channel load imbalance across Asterisk per master placement policy.
+
+Simulates conferences whose participants land on an Asterisk picked by
+Kamailio, uniformly or skewed towards the first ones, with one trunk per
+remote Asterisk to the master, and reports the spread of the channels
+(participants and trunk legs) mixed by each Asterisk.
+
+    python benchmarks/bench_placement.py --asterisks 8 --conferences 200
+    python benchmarks/bench_placement.py --skew 1.5
+"""
+import argparse
+import collections
+import random
+import statistics
+
+from app_sdk.catalog import AsteriskNode
+from app_sdk.placement import FirstCallerPlacement, LeastLoadedPlacement
+
+
+def arrivals(args, nodes):
+    weights = [1 / (i + 1) ** args.skew for i in range(len(nodes))]
+
+    calls = []
+    for conference in range(args.conferences):
+        size = random.randint(2, args.max_size)
+        calls += [conference] * size
+    random.shuffle(calls)
+
+    for conference in calls:
+        yield (conference, random.choices(nodes, weights)[0])
+
+
+def simulate(args, nodes, factory):
+    channels = collections.Counter({node.eid: 0 for node in nodes})
+    # the policy reads the live channel counts of the simulation
+    placement = factory(channels)
+    masters = dict()
+    trunks = set()
+
+    for (conference, node) in arrivals(args, nodes):
+        channels[node.eid] += 1
+
+        master = masters.get(conference)
+        if master is None:
+            master = masters[conference] = placement.choose(
+                conference, node.eid, nodes)
+
+        if node.eid != master and (conference, node.eid) not in trunks:
+            trunks.add((conference, node.eid))
+            channels[node.eid] += 1
+            channels[master] += 1
+
+    return (channels, len(trunks))
+
+
+def report(name, channels, trunks):
+    loads = list(channels.values())
+    mean = statistics.mean(loads)
+    print("%-13s trunks=%-5d max=%-6d mean=%-8.1f max/mean=%.2f "
+          "stdev=%.1f" % (name, trunks, max(loads), mean, max(loads) / mean,
+                          statistics.pstdev(loads)))
+
+
+def main(args):
+    nodes = [AsteriskNode("asterisk-%d" % i, "10.0.0.%d" % i, 5060, {}, 1)
+             for i in range(args.asterisks)]
+
+    policies = [("first_caller", lambda channels: FirstCallerPlacement()),
+                ("least_loaded", lambda channels: LeastLoadedPlacement(
+                    lambda node: channels[node.eid]))]
+
+    for (name, factory) in policies:
+        random.seed(args.seed)
+        report(name, *simulate(args, nodes, factory))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--asterisks", type=int, default=8)
+    parser.add_argument("--conferences", type=int, default=200)
+    parser.add_argument("--max-size", type=int, default=30,
+                        help="participants of the largest conference")
+    parser.add_argument("--skew", type=float, default=0.0,
+                        help="Zipf exponent of the Kamailio dispatching, 0 "
+                             "for uniform")
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
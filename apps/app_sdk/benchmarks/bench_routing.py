@@ -0,0 +1,102 @@
+"""Decode work per delivered event, wildcard vs per-application bindings.
+
+Simulates the `wazo` topic exchange of a cluster running several Stasis
+applications on several Asterisk and counts, for one application consumer,
+how many messages it has to decode for each event that it actually handles.
+
+    python benchmarks/bench_routing.py --apps 10 --asterisks 20
+"""
+import argparse
+import json
+import random
+import re
+import time
+import uuid
+
+from app_sdk import Config
+from app_sdk.amqp import APPLICATION_BINDING, WILDCARD_BINDING, binding_keys
+
+
+def topic_regex(binding):
+    # enough of the AMQP topic matching for the bindings used by the SDK
+    if binding == '#':
+        return re.compile(r'.*')
+    words = [r'[^.]+' if word == '*' else re.escape(word)
+             for word in binding.split('.')]
+    return re.compile(r'^%s$' % r'\.'.join(words))
+
+
+def make_event(app, asterisk_id):
+    return json.dumps({
+        'type': 'StasisStart',
+        'application': app,
+        'asterisk_id': asterisk_id,
+        'timestamp': '2020-01-01T00:00:00.000+0000',
+        'args': [],
+        'channel': {
+            'id': str(uuid.uuid4()),
+            'name': 'PJSIP/demo-00000001',
+            'state': 'Ring',
+            'caller': {'name': 'demo', 'number': 'demo'},
+            'connected': {'name': '', 'number': ''},
+            'accountcode': '',
+            'dialplan': {
+                'context': 'default', 'exten': '8001', 'priority': 2,
+                'app_name': 'Stasis', 'app_data': app},
+            'creationtime': '2020-01-01T00:00:00.000+0000',
+            'language': 'en'}}).encode()
+
+
+def run(mode, app_names, events, routing_key):
+    config = Config()
+    config.amqp_binding = mode
+    config.amqp_routing_key = routing_key
+
+    me = app_names[0]
+    bindings = [topic_regex(k) for k in binding_keys(config, me)]
+
+    delivered = decoded = handled = 0
+    start = time.perf_counter()
+    for (key, body) in events:
+        if not any(b.match(key) for b in bindings):
+            continue
+        delivered += 1
+
+        obj = json.loads(body)
+        decoded += 1
+
+        if obj['channel']['dialplan']['app_data'] == me:
+            handled += 1
+    elapsed = time.perf_counter() - start
+
+    print("%-12s delivered=%-7d decoded=%-7d handled=%-7d "
+          "decodes/handled=%6.2f  %.1f us/handled" % (
+              mode, delivered, decoded, handled,
+              decoded / max(handled, 1), elapsed * 1e6 / max(handled, 1)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--apps", type=int, default=10)
+    parser.add_argument("--asterisks", type=int, default=20)
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--routing-key", default='stasis.app.{app}')
+    args = parser.parse_args()
+
+    app_names = ["app%d" % i for i in range(args.apps)]
+    asterisks = ["%02x:00:00:00:00:%02x" % (i, i)
+                 for i in range(args.asterisks)]
+
+    events = []
+    for _ in range(args.events):
+        app = random.choice(app_names)
+        body = make_event(app, random.choice(asterisks))
+        events.append((args.routing_key.format(app=app, type='StasisStart'),
+                       body))
+
+    for mode in (WILDCARD_BINDING, APPLICATION_BINDING):
+        run(mode, app_names, events, args.routing_key)
+
+
+if __name__ == "__main__":
+    main()
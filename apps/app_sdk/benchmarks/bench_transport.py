@@ -0,0 +1,136 @@
+"""End-to-end event latency, AMQP bus vs direct ARI WebSocket.
+
+Needs a running stack (docker-compose up). Originates channels into a
+throw-away Stasis application on one Asterisk and measures, for each
+received event, the delay between the Asterisk `timestamp` of the event
+and its reception, first through res_stasis_amqp and RabbitMQ, then
+through an ARI WebSocket.
+
+    python benchmarks/bench_transport.py --ari http://127.0.0.1:8890
+"""
+import aiohttp
+import argparse
+import asyncio
+import asynqp
+import datetime
+import time
+import urllib.parse
+
+from app_sdk import Config
+
+APP = "benchtransport"
+
+
+def latency(event):
+    sent = datetime.datetime.strptime(event['timestamp'],
+                                      '%Y-%m-%dT%H:%M:%S.%f%z')
+    return time.time() - sent.timestamp()
+
+
+async def originate(session, args, count):
+    auth = aiohttp.BasicAuth(args.username, args.password)
+
+    ids = []
+    for _ in range(count):
+        async with session.post(
+                "%s/ari/channels" % args.ari,
+                params={'endpoint': 'Local/9999@default', 'app': APP},
+                auth=auth) as resp:
+            ids.append((await resp.json())['id'])
+        await asyncio.sleep(args.interval)
+
+    for id in ids:
+        async with session.delete("%s/ari/channels/%s" % (args.ari, id),
+                                  auth=auth):
+            pass
+
+
+async def bench_amqp(session, args, config):
+    latencies = []
+
+    async with session.post(
+            "%s/ari/amqp/%s" % (args.ari, APP),
+            auth=aiohttp.BasicAuth(args.username, args.password)):
+        pass
+
+    connection = await asynqp.connect(
+        config.amqp_host, config.amqp_port,
+        username=config.amqp_username, password=config.amqp_password)
+    channel = await connection.open_channel()
+    exchange = await channel.declare_exchange(config.amqp_exchange, 'topic')
+    queue = await channel.declare_queue(APP, exclusive=True,
+                                        auto_delete=True)
+    await queue.bind(exchange, 'stasis.app.%s' % APP)
+
+    def on_msg(msg):
+        latencies.append(latency(msg.json()))
+        msg.ack()
+
+    await queue.consume(on_msg)
+    await originate(session, args, args.calls)
+    await asyncio.sleep(1)
+    await connection.close()
+
+    return latencies
+
+
+async def bench_websocket(session, args):
+    latencies = []
+
+    url = "%s/ari/events?%s" % (
+        args.ari.replace('http', 'ws', 1), urllib.parse.urlencode({
+            'app': APP,
+            'api_key': "%s:%s" % (args.username, args.password)}))
+
+    async with session.ws_connect(url) as ws:
+        async def receive():
+            async for msg in ws:
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    latencies.append(latency(msg.json()))
+
+        task = asyncio.ensure_future(receive())
+        await originate(session, args, args.calls)
+        await asyncio.sleep(1)
+        task.cancel()
+
+    return latencies
+
+
+def report(name, latencies):
+    if not latencies:
+        print("%-10s no event received" % name)
+        return
+
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)]
+
+    print("%-10s events=%-5d p50=%6.1f ms  p90=%6.1f ms  p99=%6.1f ms" % (
+        name, len(latencies), pct(0.5) * 1e3, pct(0.9) * 1e3,
+        pct(0.99) * 1e3))
+
+
+async def main(args):
+    config = Config()
+    if args.conf:
+        config.from_conf(args.conf)
+
+    async with aiohttp.ClientSession() as session:
+        report("amqp", await bench_amqp(session, args, config))
+        report("websocket", await bench_websocket(session, args))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ari", default="http://127.0.0.1:8890",
+                        help="ARI of one Asterisk, http://<IP>:<Port>")
+    parser.add_argument("--username", default="wazo")
+    parser.add_argument("--password", default="wazo")
+    parser.add_argument("--conf", default="",
+                        help="application config file for the AMQP settings")
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=0.01)
+    args = parser.parse_args()
+
+    asyncio.get_event_loop().run_until_complete(main(args))
@@ -40,6 +40,9 @@ setup(
         "yarl==1.4.2",
         "zipp==0.6.0"
     ],
+    extras_require={
+        "fast": ["orjson"],
+    },
     packages=find_packages(),
     include_package_data=True,
     long_description=""
@@ -0,0 +1,43 @@
+"""Routing keys of the application queue.
+
+    python -m unittest discover -s tests
+"""
+import types
+import unittest
+
+from app_sdk.amqp import (APPLICATION_BINDING, WILDCARD_BINDING,
+                          binding_keys, stale_binding_keys)
+
+
+def config(binding=APPLICATION_BINDING, routing_key='stasis.app.{app}',
+           event_types=()):
+    return types.SimpleNamespace(amqp_binding=binding,
+                                 amqp_routing_key=routing_key,
+                                 amqp_event_types=list(event_types))
+
+
+class BindingKeysTest(unittest.TestCase):
+
+    def test_application(self):
+        c = config()
+        self.assertEqual(binding_keys(c, 'conf'), ['stasis.app.conf'])
+        self.assertEqual(stale_binding_keys(c, 'conf'), ['#'])
+
+    def test_event_types(self):
+        c = config(routing_key='stasis.app.{app}.{type}')
+        self.assertEqual(binding_keys(c, 'conf', ['StasisStart']),
+                         ['stasis.app.conf.StasisStart'])
+        self.assertEqual(stale_binding_keys(c, 'conf', ['StasisStart']),
+                         ['#', 'stasis.app.conf.*'])
+
+        self.assertEqual(binding_keys(c, 'conf'), ['stasis.app.conf.*'])
+        self.assertEqual(stale_binding_keys(c, 'conf'), ['#'])
+
+    def test_wildcard(self):
+        c = config(binding=WILDCARD_BINDING)
+        self.assertEqual(binding_keys(c, 'conf'), ['#'])
+        self.assertEqual(stale_binding_keys(c, 'conf'), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+"""Master, members and participants of a bridge when an Asterisk leaves it.
+
+    python -m unittest discover -s tests
+"""
+import asyncio
+import unittest
+
+from app_sdk.bridge_registry import MemoryBridgeRegistry, remove_member
+from app_sdk.topology import TreeTopology
+
+BRIDGE_ID = "conf"
+
+
+class RemoveMemberTest(unittest.TestCase):
+
+    def test_keeps_master(self):
+        self.assertEqual(remove_member("B", ["A", "B", "C"], "C"),
+                         ("B", ["A", "B"]))
+        self.assertEqual(remove_member("B", ["A", "B", "C"], "A"),
+                         ("B", ["C", "B"]))
+
+    def test_promotes_last_joined(self):
+        self.assertEqual(remove_member("B", ["A", "B", "C"], "B"),
+                         ("C", ["A", "C"]))
+        self.assertEqual(remove_member("C", ["A", "B", "C"], "C"),
+                         ("B", ["A", "B"]))
+
+    def test_master_not_member(self):
+        self.assertEqual(remove_member("M", ["A", "B"], "M"),
+                         ("B", ["A", "B"]))
+
+    def test_last_one(self):
+        self.assertEqual(remove_member("A", ["A"], "A"), (None, []))
+        self.assertEqual(remove_member("M", ["A"], "A"), (None, []))
+
+    def test_tree_places_kept(self):
+        topology = TreeTopology(2)
+        members = ["A", "B", "C", "D", "E", "F"]
+
+        for leaving in members:
+            before = topology.order("A", members)
+            (master, after) = remove_member("A", members, leaving)
+            after = topology.order(master, after)
+
+            self.assertEqual(after[0], before[-1] if leaving == "A" else "A")
+            moved = [m for (i, m) in enumerate(after) if before[i] != m]
+            self.assertEqual(moved, [] if leaving == before[-1]
+                             else [before[-1]])
+
+
+class MemoryBridgeRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.registry = MemoryBridgeRegistry()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_steps(self, *coros):
+        for coro in coros:
+            self.loop.run_until_complete(coro)
+
+    def test_member_leaving_keeps_master(self):
+        registry = self.registry
+        self.run_steps(registry.elect(BRIDGE_ID, "B"),
+                       registry.join(BRIDGE_ID, "A"),
+                       registry.join(BRIDGE_ID, "B"),
+                       registry.join(BRIDGE_ID, "C"),
+                       registry.leave(BRIDGE_ID, "C"))
+
+        self.assertEqual(registry.master(BRIDGE_ID), "B")
+        self.assertEqual(registry.members[BRIDGE_ID], ["A", "B"])
+
+    def test_master_leaving(self):
+        registry = self.registry
+        self.run_steps(registry.elect(BRIDGE_ID, "M"),
+                       registry.join(BRIDGE_ID, "A"),
+                       registry.join(BRIDGE_ID, "B"),
+                       registry.leave(BRIDGE_ID, "M"))
+
+        self.assertEqual(registry.master(BRIDGE_ID), "B")
+
+        self.run_steps(registry.leave(BRIDGE_ID, "A"),
+                       registry.leave(BRIDGE_ID, "B"))
+        self.assertIsNone(registry.master(BRIDGE_ID))
+        self.assertNotIn(BRIDGE_ID, registry.members)
+
+    def test_participants(self):
+        registry = self.registry
+        count = self.loop.run_until_complete
+        self.assertEqual(count(registry.add_participant(BRIDGE_ID, "A")), 1)
+        self.assertEqual(count(registry.add_participant(BRIDGE_ID, "A")), 2)
+        self.assertEqual(count(registry.add_participant(BRIDGE_ID, "B")), 1)
+        self.assertEqual(count(registry.remove_participant(BRIDGE_ID, "A")),
+                         1)
+        self.assertEqual(count(registry.remove_participant(BRIDGE_ID, "A")),
+                         0)
+        self.assertEqual(count(registry.remove_participant(BRIDGE_ID, "A")),
+                         0)
+        self.assertNotIn((BRIDGE_ID, "A"), registry.participants)
+
+        # an Asterisk gone leaves with its participants
+        self.run_steps(registry.join(BRIDGE_ID, "B"),
+                       registry.leave(BRIDGE_ID, "B"))
+        self.assertEqual(registry.participants, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
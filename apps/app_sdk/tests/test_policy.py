@@ -0,0 +1,176 @@
+"""Circuit breaker transitions of the ARI call policy.
+
+    python -m unittest discover -s tests
+"""
+import asyncio
+import types
+import unittest
+
+from app_sdk.policy import (CLOSED, HALF_OPEN, OPEN, CallPolicy,
+                            CircuitBreaker, CircuitOpenError)
+
+ASTERISK_ID = "asterisk-1"
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.breaker = CircuitBreaker(2, 30, clock=self.clock)
+
+    def open(self):
+        self.breaker.failure()
+        self.breaker.failure()
+
+    def test_opens_after_threshold(self):
+        self.breaker.failure()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+        self.breaker.failure()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_half_open_lets_one_probe_through(self):
+        self.open()
+
+        self.clock.now = 30
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_probe_success_closes(self):
+        self.open()
+        self.clock.now = 30
+        self.breaker.allow()
+
+        self.breaker.success()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_probe_failure_reopens(self):
+        self.open()
+        self.clock.now = 30
+        self.breaker.allow()
+
+        self.breaker.failure()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+
+        self.clock.now = 60
+        self.assertTrue(self.breaker.allow())
+
+    def test_aborted_probe_reopens(self):
+        self.open()
+        self.clock.now = 30
+        self.breaker.allow()
+
+        self.breaker.abort()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertTrue(self.breaker.allow())
+
+    def test_abort_keeps_closed(self):
+        self.breaker.failure()
+        self.breaker.abort()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.failures, 1)
+
+
+class CallPolicyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.clock = Clock()
+
+        config = types.SimpleNamespace(
+            api_timeout=1, api_timeouts={}, api_retries=0,
+            api_breaker_threshold=1, api_breaker_reset=30)
+        self.policy = CallPolicy(config)
+        self.breaker = self.policy.breakers[ASTERISK_ID] = CircuitBreaker(
+            1, 30, clock=self.clock)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def call(self, func):
+        return self.loop.run_until_complete(
+            self.policy.call('op', ASTERISK_ID, func))
+
+    def half_open(self):
+        async def timeout(**kwargs):
+            raise asyncio.TimeoutError()
+
+        with self.assertRaises(asyncio.TimeoutError):
+            self.call(timeout)
+        self.assertEqual(self.breaker.state, OPEN)
+
+        self.clock.now = 30
+
+    def test_open_circuit_fails_fast(self):
+        self.half_open()
+        self.clock.now = 0
+
+        async def ok(**kwargs):
+            return 'ok'
+
+        with self.assertRaises(CircuitOpenError):
+            self.call(ok)
+
+    def test_probe_success_closes(self):
+        self.half_open()
+
+        async def ok(**kwargs):
+            return 'ok'
+
+        self.assertEqual(self.call(ok), 'ok')
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_cancelled_probe_reopens(self):
+        self.half_open()
+
+        async def hang(**kwargs):
+            await asyncio.sleep(10)
+
+        task = self.loop.create_task(
+            self.policy.call('op', ASTERISK_ID, hang))
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            self.loop.run_until_complete(task)
+        self.assertEqual(self.breaker.state, OPEN)
+
+        async def ok(**kwargs):
+            return 'ok'
+
+        self.assertEqual(self.call(ok), 'ok')
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_unexpected_error_reopens(self):
+        self.half_open()
+
+        async def invalid(**kwargs):
+            raise ValueError("invalid answer")
+
+        with self.assertRaises(ValueError):
+            self.call(invalid)
+        self.assertEqual(self.breaker.state, OPEN)
+
+        async def ok(**kwargs):
+            return 'ok'
+
+        self.assertEqual(self.call(ok), 'ok')
+
+
+if __name__ == "__main__":
+    unittest.main()
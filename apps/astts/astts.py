@@ -33,6 +33,9 @@ class AsttsApplication(Application):
 
         self.nicknames = dict()
 
+        self.metrics.callback('astts_tts_tasks', 'Running TTS tasks',
+                              lambda: len(self.tts_tasks))
+
     async def say(self, text=""):
         text = text.rstrip('.wav')
 
@@ -90,6 +93,9 @@ class AsttsApplication(Application):
             task.cancel()
             self.tts_tasks.pop(context)
 
+    async def on_expired(self, context):
+        await self.on_end(context)
+
     async def on_up(self, context):
         task = asyncio.create_task(
             self.say_asterisk_id(context))
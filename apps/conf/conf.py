@@ -4,6 +4,7 @@ import argparse
 import os
 import errno
 import os.path
+import re
 
 from app_sdk import Application, Config
 
@@ -11,16 +12,54 @@ logger = logging.getLogger(__name__)
 
 
 APP_NAME = "conf"
-BRIDGE_ID = "conf"
+
+# channel variable overriding the room of the dialed extension
+ROOM_VARIABLE = "CONF_ROOM"
+# extension of the trunks between the Asterisk of a room, see
+# extensions.conf
+TRUNK_EXTEN_PREFIX = "room-"
+# rooms end up in the bridge id of the ARI paths and in the dialed SIP URI
+ROOM_PATTERN = re.compile(r'[A-Za-z0-9_-]+')
 
 
 class BridgeApplication(Application):
+    """One mixing bridge per room, the room being the dialed extension or
+    the CONF_ROOM channel variable."""
+
+    def room(self, context):
+        """Room of the channel, None if it is not a valid room name."""
+        variables = context.channel.extras.get('channelvars') or {}
+        room = variables.get(ROOM_VARIABLE)
+        if room:
+            if ROOM_PATTERN.fullmatch(room):
+                return room
+            logger.warning("Ignoring invalid %s %r of channel %s" %
+                           (ROOM_VARIABLE, room, context))
+
+        room = context.channel.exten or ''
+        if room.startswith(TRUNK_EXTEN_PREFIX):
+            room = room[len(TRUNK_EXTEN_PREFIX):]
+        if ROOM_PATTERN.fullmatch(room):
+            return room
 
     async def on_start(self, context):
         logger.info(
             "Starting application on channel %s" % context)
 
-        await self.get_or_create_bridge(context, BRIDGE_ID, "mixing")
+        room = self.room(context)
+        if room is None:
+            # trunks dialed to another Asterisk have no room of their own
+            if self.trunk_bridge(context) is None:
+                logger.error("No valid room for channel %s" % context)
+                await self.hangup(context)
+            return
+
+        bridge_id = "conf-%s" % room
+        context.set_user_data(bridge_id)
+
+        await self.get_or_create_bridge(
+            context, bridge_id, "mixing",
+            extension="%s%s" % (TRUNK_EXTEN_PREFIX, room))
         await self.answer(context)
 
     async def on_end(self, context):
@@ -28,7 +67,10 @@ class BridgeApplication(Application):
             "End of application on channel %s" % context)
 
     async def on_up(self, context):
-        await self.bridge_add_channel(context, BRIDGE_ID)
+        # trunks dialed to another Asterisk have no room of their own
+        bridge_id = context.get_user_data() or self.trunk_bridge(context)
+        if bridge_id:
+            await self.bridge_add_channel(context, bridge_id)
 
 
 def main():
@@ -60,6 +102,9 @@ def main():
     if args.port:
         config.port = args.port
 
+    if 'channelvars' not in config.channel_extras:
+        config.channel_extras.append('channelvars')
+
     app = BridgeApplication(config, args.id, APP_NAME,
                             register=args.register)
     app.launch()